@@ -0,0 +1,78 @@
+"""
+Counts database transactions committed by each auth endpoint.
+
+    python benchmarks/commits_per_request.py
+
+Runs the sign-up / confirm / login / refresh / password reset flow against a throwaway
+SQLite database and prints, as JSON, how many COMMITs every request issued.
+Every endpoint commits once, 7 in total. To compare with an older revision, run this
+file from a checkout of that revision.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from main import app  # noqa: E402
+from src.database.db import get_db  # noqa: E402
+from src.database.models import Base  # noqa: E402
+from src.services.auth import authtoken  # noqa: E402
+
+EMAIL = 'bench@example.com'
+PASSWORD = 'qwerty'
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    commits = [0]
+    event.listen(engine, 'commit', lambda conn: commits.__setitem__(0, commits[0] + 1))
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+    results = OrderedDict()
+
+    def measure(name, method, url, **kwargs):
+        commits[0] = 0
+        response = client.request(method, url, **kwargs)
+        assert response.status_code < 400, (name, response.status_code, response.text)
+        results[name] = commits[0]
+        return response
+
+    measure('signup', 'POST', '/api/auth/signup', json={'username': 'bench', 'email': EMAIL, 'password': PASSWORD})
+    email_token = asyncio.run(authtoken.create_email_token({'sub': EMAIL}))
+    measure('confirmed_email', 'GET', f'/api/auth/confirmed_email/{email_token}')
+    tokens = measure('login', 'POST', '/api/auth/login', data={'username': EMAIL, 'password': PASSWORD}).json()
+    measure('refresh_token', 'POST', '/api/auth/refresh_token',
+            headers={'Authorization': f'Bearer {tokens["refresh_token"]}'})
+    measure('password_reset', 'POST', '/api/auth/password_reset', params={'email': EMAIL})
+    reset_token = measure('password_reset_confirm', 'GET', f'/api/auth/password_reset_confirm/{email_token}') \
+        .json()['reset_token']
+    measure('set_new_password', 'POST', '/api/auth/set_new_password',
+            json={'reset_password_token': reset_token, 'new_password': 'new_password',
+                  'confirm_password': 'new_password'})
+
+    results['total'] = sum(results.values())
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
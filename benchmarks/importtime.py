@@ -0,0 +1,57 @@
+"""
+Measures how long importing the app takes.
+
+    python benchmarks/importtime.py [module] [--runs N] [--top N]
+
+Imports the module (``main`` by default) in fresh interpreters with ``python -X importtime``
+and prints, as JSON, the median total import time and the slowest modules by cumulative time.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module):
+    """
+    The import_times function imports the module in a new interpreter and parses the -X importtime report.
+
+    :param module: str: The module to import
+    :return: A dict of module name to cumulative import time in microseconds
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('module', nargs='?', default='main')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    total = statistics.median(run[args.module] for run in runs)
+    modules = {name: statistics.median(run.get(name, 0) for run in runs) for name in runs[-1]}
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[1:args.top + 1]
+    print(json.dumps({
+        'module': args.module,
+        'runs': args.runs,
+        'total_ms': round(total / 1000, 1),
+        'slowest_ms': {name: round(us / 1000, 1) for name, us in slowest},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
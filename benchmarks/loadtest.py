@@ -0,0 +1,234 @@
+"""
+Load test of the contacts API.
+
+    python benchmarks/loadtest.py --users 20 --contacts 500 --concurrency 20 --duration 30 --no-rate-limit
+
+Seeds a database (benchmarks/seed.py), starts the app with uvicorn against it and waits for /readyz,
+then every virtual user logs in and runs a weighted mix of list / search / birthdays / get /
+create / update / delete requests with an async httpx client. Redis must be running, as for the app itself.
+Pass --url to test an app that is already running and seeded instead.
+
+Prints, as JSON, the count, errors, throughput and p50/p95/p99 latency of every endpoint.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+from benchmarks.seed import FIRST_NAMES, PASSWORD, fake_contact, seed, user_email  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# endpoint name -> weight in the request mix
+SCENARIO = {
+    'list': 30,
+    'search': 20,
+    'get': 15,
+    'birthdays': 10,
+    'create': 10,
+    'update': 10,
+    'delete': 5,
+}
+
+
+def percentile(samples, q: float) -> float:
+    """
+    The percentile function returns the nearest-rank percentile of the samples.
+
+    :param samples: Sorted latencies
+    :param q: float: The percentile, between 0 and 100
+    :return: The latency at that percentile
+    """
+    if not samples:
+        return 0.0
+    rank = max(1, round(q / 100 * len(samples)))
+    return samples[min(rank, len(samples)) - 1]
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, name: str, client: httpx.AsyncClient, method: str, url: str, ok=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - started)
+        if response.status_code not in ok:
+            self.errors[name] += 1
+            return None
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            samples = sorted(self.latencies[name])
+            endpoints[name] = {
+                'count': len(samples),
+                'errors': self.errors[name],
+                'rps': round(len(samples) / elapsed, 1),
+                'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                'p95_ms': round(percentile(samples, 95) * 1000, 2),
+                'p99_ms': round(percentile(samples, 99) * 1000, 2),
+            }
+        everything = sorted(latency for samples in self.latencies.values() for latency in samples)
+        total = {
+            'count': len(everything),
+            'errors': sum(self.errors.values()),
+            'rps': round(len(everything) / elapsed, 1),
+            'p50_ms': round(percentile(everything, 50) * 1000, 2),
+            'p95_ms': round(percentile(everything, 95) * 1000, 2),
+            'p99_ms': round(percentile(everything, 99) * 1000, 2),
+        }
+        return {'elapsed_s': round(elapsed, 2), 'endpoints': endpoints, 'total': total}
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: Recorder, email: str, deadline: float,
+                       rng: random.Random, slot: int = 0, slots: int = 1):
+    """
+    The virtual_user function logs in as one seeded user and sends requests from the scenario until the deadline.
+
+    :param client: httpx.AsyncClient: The client shared by all virtual users
+    :param recorder: Recorder: Collects the latencies
+    :param email: str: The seeded user to log in as
+    :param deadline: float: time.perf_counter() value to stop at
+    :param rng: random.Random: Picks the requests, seeded per virtual user
+    :param slot: int: Which share of the user's contacts this virtual user may change
+    :param slots: int: How many virtual users log in as the same user
+    :return: None
+    """
+    response = await recorder.request('login', client, 'POST', '/api/auth/login',
+                                      data={'username': email, 'password': PASSWORD})
+    if response is None:
+        return
+    headers = {'Authorization': f'Bearer {response.json()["access_token"]}'}
+    response = await recorder.request('list', client, 'GET', '/api/contacts/', params={'limit': 100},
+                                      headers=headers)
+    contacts = response.json() if response is not None else []
+    contact_ids = [contact['id'] for contact in contacts][slot::slots]
+    emails = [contact['email'] for contact in contacts]
+    names, weights = list(SCENARIO), list(SCENARIO.values())
+    created = 0
+
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        if name == 'list':
+            await recorder.request(name, client, 'GET', '/api/contacts/',
+                                   params={'skip': rng.randrange(0, 400), 'limit': 50}, headers=headers)
+        elif name == 'search':
+            # search matches names and emails exactly
+            params = {'first_name': rng.choice(FIRST_NAMES)}
+            if emails and rng.random() < 0.5:
+                params = {'email': rng.choice(emails)}
+            await recorder.request(name, client, 'GET', '/api/contacts/search', params=params, headers=headers)
+        elif name == 'birthdays':
+            await recorder.request(name, client, 'GET', '/api/contacts/birthdays', headers=headers)
+        elif name == 'get' and contact_ids:
+            await recorder.request(name, client, 'GET', f'/api/contacts/{rng.choice(contact_ids)}',
+                                   headers=headers)
+        elif name in ('create', 'update'):
+            # the owner is taken from the token, user_id in the body is ignored
+            body = fake_contact(rng, 0, 100000 + created)
+            body['birthday'] = body['birthday'].isoformat()
+            created += 1
+            if name == 'create':
+                response = await recorder.request(name, client, 'POST', '/api/contacts/', ok=(201,), json=body,
+                                                  headers=headers)
+                if response is not None:
+                    contact_ids.append(response.json()['id'])
+            elif contact_ids:
+                await recorder.request(name, client, 'PUT', f'/api/contacts/{rng.choice(contact_ids)}', json=body,
+                                       headers=headers)
+        elif name == 'delete' and len(contact_ids) > 1:
+            contact_id = contact_ids.pop(rng.randrange(len(contact_ids)))
+            await recorder.request(name, client, 'DELETE', f'/api/contacts/{contact_id}', ok=(204,),
+                                   headers=headers)
+
+
+async def run_load(url: str, users: int, concurrency: int, duration: float, seed: int):
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        slots = -(-concurrency // users)
+        await asyncio.gather(*(virtual_user(client, recorder, user_email(i % users), deadline,
+                                            random.Random(seed * 10007 + i), slot=i // users, slots=slots)
+                               for i in range(concurrency)))
+        return recorder.report(time.perf_counter() - started)
+
+
+def wait_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    last = None
+    while time.monotonic() < deadline:
+        try:
+            last = httpx.get(f'{url}/readyz', timeout=5)
+            if last.status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f'app did not become ready: {last.text if last is not None else "no response"}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='test an already running and seeded app instead of starting one')
+    parser.add_argument('--database-url', help='defaults to a throwaway SQLite file')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--contacts', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--no-rate-limit', action='store_true', help="start the app with RATE_LIMIT_MODE=off")
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'loadtest.db')}"
+        seed(create_engine(database_url), args.users, args.contacts, args.seed)
+        env = dict(os.environ, SQLALCHEMY_DATABASE_URL=database_url)
+        if args.no_rate_limit:
+            env['RATE_LIMIT_MODE'] = 'off'
+        server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(args.port),
+                                   '--workers', str(args.workers), '--log-level', 'warning'], cwd=ROOT, env=env)
+        url = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_ready(url)
+        report = asyncio.run(run_load(url, args.users, args.concurrency, args.duration, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'database_url')}
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
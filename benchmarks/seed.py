@@ -0,0 +1,121 @@
+"""
+Fills a database with synthetic users and contacts for load tests.
+
+    python benchmarks/seed.py --database-url sqlite:///./loadtest.db --users 20 --contacts 500
+
+Users are named user{i}@loadtest.example, are confirmed and share the password ``loadtest``.
+The same --seed always produces the same rows.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, delete, insert, select  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from src.database.models import Base, Contact, User  # noqa: E402
+from src.services.auth import authpassword  # noqa: E402
+from src.services.duplicates import blocking_keys  # noqa: E402
+
+PASSWORD = 'loadtest'
+EMAIL_DOMAIN = 'loadtest.example'
+FIRST_NAMES = ('Anna', 'Bohdan', 'Daria', 'Ivan', 'Kateryna', 'Maksym', 'Olena', 'Petro', 'Sofia', 'Taras',
+               'Yulia', 'Andrii', 'Iryna', 'Oleh', 'Nazar', 'Marta')
+LAST_NAMES = ('Shevchenko', 'Kovalenko', 'Bondarenko', 'Tkachenko', 'Kravchenko', 'Oliinyk', 'Shevchuk',
+              'Polishchuk', 'Lysenko', 'Melnyk', 'Boiko', 'Savchenko')
+STREETS = ('Khreshchatyk', 'Sichovykh Striltsiv', 'Velyka Vasylkivska', 'Pushkinska', 'Sumska', 'Deribasivska')
+
+
+def user_email(i: int) -> str:
+    return f'user{i}@{EMAIL_DOMAIN}'
+
+
+def fake_contact(rng: random.Random, user_id: int, j: int) -> dict:
+    """
+    The fake_contact function builds one contact row. About one contact in 12 has a birthday in the next week,
+    so the birthdays endpoint always has something to return.
+
+    :param rng: random.Random: The seeded generator
+    :param user_id: int: The owner of the contact
+    :param j: int: The number of the contact, keeps emails unique
+    :return: The column values of the contact
+    """
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    if rng.random() < 1 / 12:
+        upcoming = date.today() + timedelta(days=rng.randrange(7))
+        birthday = date(rng.randrange(1950, 2005), upcoming.month, min(upcoming.day, 28))
+    else:
+        birthday = date(1950, 1, 1) + timedelta(days=rng.randrange(55 * 365))
+    return {
+        'first_name': first_name,
+        'last_name': last_name,
+        'email': f'{first_name.lower()}.{last_name.lower()}{j}@mail.example',
+        'phone_number': f'+380{rng.randrange(10 ** 9):09d}',
+        'birthday': birthday,
+        'address': f'{rng.choice(STREETS)} st. {rng.randrange(1, 200)}',
+        'user_id': user_id,
+    }
+
+
+def seed(engine, users: int, contacts: int, seed: int = 0, batch_size: int = 1000):
+    """
+    The seed function replaces the load test users and their contacts with fresh synthetic rows.
+    Contacts are inserted with executemany in batches, and the password is hashed only once.
+
+    :param engine: The engine of the database to fill
+    :param users: int: How many users to create
+    :param contacts: int: How many contacts every user gets
+    :param seed: int: Seed of the random generator
+    :param batch_size: int: Rows per INSERT batch
+    :return: The ids of the created users
+    """
+    rng = random.Random(seed)
+    Base.metadata.create_all(bind=engine)
+    hashed = authpassword.get_hash_password(PASSWORD)
+    with Session(engine) as db:
+        old = select(User.id).where(User.email.like(f'%@{EMAIL_DOMAIN}'))
+        db.execute(delete(Contact).where(Contact.user_id.in_(old)))
+        db.execute(delete(User).where(User.email.like(f'%@{EMAIL_DOMAIN}')))
+        user_ids = db.scalars(insert(User).returning(User.id), [
+            {'username': f'user{i}', 'email': user_email(i), 'password': hashed, 'email_confirm': True}
+            for i in range(users)
+        ]).all()
+        rows = []
+        for user_id in user_ids:
+            for j in range(contacts):
+                contact = fake_contact(rng, user_id, j)
+                rows.append({**contact, **blocking_keys(contact['first_name'], contact['last_name'],
+                                                        contact['email'], contact['phone_number'])})
+                if len(rows) >= batch_size:
+                    db.execute(insert(Contact), rows)
+                    rows = []
+        if rows:
+            db.execute(insert(Contact), rows)
+        db.commit()
+    return list(user_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', default=os.environ.get('SQLALCHEMY_DATABASE_URL', 'sqlite:///./loadtest.db'))
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--contacts', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    started = time.perf_counter()
+    user_ids = seed(engine, args.users, args.contacts, args.seed)
+    print(json.dumps({'users': len(user_ids), 'contacts': len(user_ids) * args.contacts,
+                      'seconds': round(time.perf_counter() - started, 2)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,30 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-import redis.asyncio as redis
-from fastapi_limiter import FastAPILimiter
 
 from src.database.db import get_db
 from src.routes import auth, contacts, users
 from src.conf.config import settings
+from src.services.avatar import avatar_uploader, UploadLimitMiddleware
+from src.services.cloudinary import ImmutableStaticFiles
+from src.services.limiter import RateLimiter
+from src.services.looplag import loop_monitor
+from src.services.metrics import MetricsMiddleware, check_metrics, render_metrics
+from src.services.profiling import ProfilingMiddleware
+from src.services.resources import resources
+from src.services.tracing import TracingMiddleware, instrument, tracer
+from src.services.warmup import warmup
 
 app = FastAPI()
 
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
+if settings.avatar_storage == 'local':
+    app.mount(settings.avatar_base_url.rstrip('/'),
+              ImmutableStaticFiles(directory=settings.avatar_local_path, check_dir=False), name='avatars')
 
 @app.on_event("startup")
 async def startup():
@@ -21,12 +32,35 @@ async def startup():
     The startup function is called when the application starts up.
     It's a good place to initialize things that are needed by your app,
     such as connecting to databases or initializing caches.
+    The connection pools are owned by src.services.resources and opened on first use.
+    The worker is warmed up here and reports ready on /readyz afterwards.
 
     :return: A coroutine
     :doc-author: Trelent
     """
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
-    await FastAPILimiter.init(r)
+    if settings.loop_lag_enabled:
+        loop_monitor.start()
+    if settings.metrics_enabled:
+        check_metrics()
+    await RateLimiter.init(resources.redis)
+    await warmup.run()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    The shutdown function is called when the application stops.
+    It reports not ready and stops the warm-up retries, flushes the local rate limit buckets that were not yet
+    synced to redis, stops the avatar workers, waits for the database connections still in use and closes every pool.
+
+    :return: A coroutine
+    """
+    await warmup.stop()
+    await RateLimiter.close()
+    await avatar_uploader.storage.close()
+    await resources.close()
+    tracer.close()
+    await loop_monitor.stop()
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,6 +69,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(UploadLimitMiddleware, path='/api/users/avatar', max_size=settings.avatar_max_size)
+if settings.tracing_enabled:
+    instrument()
+    app.add_middleware(TracingMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+if settings.profiling_secret:
+    app.add_middleware(ProfilingMiddleware)
 
 @app.get("/")
 def read_root():
@@ -60,3 +102,29 @@ def healthchecker(db: Session = Depends(get_db)):
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error connecting to the database")
+
+
+@app.get("/readyz")
+def readyz():
+    """
+    The readyz function tells the load balancer whether this worker has finished its warm-up.
+    It answers 503 until then, and again once the worker starts shutting down.
+
+    :return: The outcome of every warm-up step
+    """
+    status_code = status.HTTP_200_OK if warmup.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse({'ready': warmup.ready, 'checks': warmup.checks}, status_code=status_code)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    The metrics function exposes the Prometheus metrics of this worker.
+
+    :return: The metrics in the Prometheus text format
+    """
+    rendered = render_metrics() if settings.metrics_enabled else None
+    if rendered is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are not enabled")
+    body, content_type = rendered
+    return Response(body, media_type=content_type)
@@ -0,0 +1,97 @@
+"""Partition contacts by user_id
+
+Revision ID: 31f71d8cb4ce
+Revises: e71f5c08b2a4
+Create Date: 2026-10-18 21:10:42.517309
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '31f71d8cb4ce'
+down_revision = 'e71f5c08b2a4'
+branch_labels = None
+depends_on = None
+
+PARTITIONS = 16
+COLUMNS = 'id, first_name, last_name, email, phone_number, birthday, address, created_at, user_id'
+INDEXES = ('first_name', 'last_name', 'email')
+
+
+def create_contacts(name, partitioned):
+    """
+    Creates a copy of the contacts table that takes its ids from the existing contacts_id_seq.
+    The partitioned copy is hash partitioned by user_id, so its primary key has to include user_id.
+    """
+    op.create_table(name,
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('contacts_id_seq'::regclass)"), nullable=False),
+    sa.Column('first_name', sa.String(length=50), nullable=False),
+    sa.Column('last_name', sa.String(length=50), nullable=False),
+    sa.Column('email', sa.String(length=50), nullable=False),
+    sa.Column('phone_number', sa.String(length=20), nullable=False),
+    sa.Column('birthday', sa.Date(), nullable=True),
+    sa.Column('address', sa.String(length=200), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=not partitioned),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=f'{name}_user_id_fkey'),
+    sa.PrimaryKeyConstraint(*(('id', 'user_id') if partitioned else ('id',)), name=f'{name}_pkey'),
+    **({'postgresql_partition_by': 'HASH (user_id)'} if partitioned else {})
+    )
+    if partitioned:
+        for remainder in range(PARTITIONS):
+            op.execute(f'CREATE TABLE contacts_p{remainder} PARTITION OF {name} '
+                       f'FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})')
+
+
+def swap_contacts(name, indexes):
+    """
+    Copies the rows into the new table, drops the old one and gives the new one the names of the old table.
+    """
+    op.execute('ALTER SEQUENCE contacts_id_seq OWNED BY NONE')
+    op.execute(f'INSERT INTO {name} ({COLUMNS}) SELECT {COLUMNS} FROM contacts')
+    op.drop_table('contacts')
+    op.rename_table(name, 'contacts')
+    op.execute(f'ALTER TABLE contacts RENAME CONSTRAINT {name}_pkey TO contacts_pkey')
+    op.execute(f'ALTER TABLE contacts RENAME CONSTRAINT {name}_user_id_fkey TO contacts_user_id_fkey')
+    op.execute('ALTER SEQUENCE contacts_id_seq OWNED BY contacts.id')
+    for column in indexes:
+        op.create_index(op.f(f'ix_contacts_{column}'), 'contacts', [column], unique=False)
+    op.execute('ANALYZE contacts')
+
+
+def check_owners():
+    """
+    Stops the migration if some contacts have no owner. Such contacts have no partition and user_id
+    becomes NOT NULL, so they have to be assigned to a user or deleted first.
+    """
+    message = 'contacts without an owner have to be assigned to a user or deleted first'
+    if not op.get_context().as_sql:
+        orphans = op.get_bind().execute(sa.text('SELECT count(*) FROM contacts WHERE user_id IS NULL')).scalar()
+        if orphans:
+            raise RuntimeError(f'{orphans} {message}')
+    elif op.get_context().dialect.name == 'postgresql':
+        op.execute(f"DO $$ BEGIN IF EXISTS (SELECT 1 FROM contacts WHERE user_id IS NULL) THEN "
+                   f"RAISE EXCEPTION '{message}'; END IF; END $$")
+
+
+def upgrade() -> None:
+    check_owners()
+    if op.get_context().dialect.name != 'postgresql':
+        op.create_index(op.f('ix_contacts_user_id'), 'contacts', ['user_id'], unique=False)
+        with op.batch_alter_table('contacts') as batch_op:
+            batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=False)
+        return
+    create_contacts('contacts_partitioned', partitioned=True)
+    swap_contacts('contacts_partitioned', INDEXES + ('user_id',))
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        with op.batch_alter_table('contacts') as batch_op:
+            batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=True)
+        op.drop_index(op.f('ix_contacts_user_id'), table_name='contacts')
+        return
+    create_contacts('contacts_unpartitioned', partitioned=False)
+    swap_contacts('contacts_unpartitioned', INDEXES)
@@ -0,0 +1,105 @@
+"""Contact blocking keys
+
+Revision ID: 892f41e10295
+Revises: 31f71d8cb4ce
+Create Date: 2026-10-18 21:42:17.208315
+
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '892f41e10295'
+down_revision = '31f71d8cb4ce'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+PHONE_KEY_DIGITS = 9
+GMAIL_DOMAINS = ('gmail.com', 'googlemail.com')
+
+
+# The keys as src.services.duplicates computed them when this migration was written.
+# They are copied here so the backfill stays the same whatever the app does later.
+def normalize_email(email):
+    if not email or '@' not in email:
+        return None
+    local, _, domain = email.strip().lower().rpartition('@')
+    local = local.split('+', 1)[0]
+    if domain in GMAIL_DOMAINS:
+        local, domain = local.replace('.', ''), 'gmail.com'
+    return f'{local}@{domain}' if local else None
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) < 7:
+        return None
+    return digits[-PHONE_KEY_DIGITS:]
+
+
+def name_tokens(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return re.findall(r'\w+', value.lower())
+
+
+def normalize_name(first_name, last_name):
+    tokens = sorted(name_tokens(first_name) + name_tokens(last_name))
+    return ' '.join(tokens)[:100] or None
+
+
+def blocking_keys(first_name, last_name, email, phone_number):
+    return {
+        'email_key': normalize_email(email),
+        'phone_key': normalize_phone(phone_number),
+        'name_key': normalize_name(first_name, last_name),
+    }
+
+
+def backfill():
+    """
+    Computes the keys of the existing contacts in batches, walking the table by id.
+    """
+    conn = op.get_bind()
+    select = sa.text('SELECT id, user_id, first_name, last_name, email, phone_number FROM contacts '
+                     'WHERE id > :last_id ORDER BY id LIMIT :limit')
+    update = sa.text('UPDATE contacts SET email_key = :email_key, phone_key = :phone_key, name_key = :name_key '
+                     'WHERE id = :id AND user_id = :user_id')
+    last_id = 0
+    while True:
+        rows = conn.execute(select, {'last_id': last_id, 'limit': BATCH_SIZE}).all()
+        if not rows:
+            break
+        conn.execute(update, [{'id': row.id, 'user_id': row.user_id,
+                               **blocking_keys(row.first_name, row.last_name, row.email, row.phone_number)}
+                              for row in rows])
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.add_column('contacts', sa.Column('email_key', sa.String(length=150), nullable=True))
+    op.add_column('contacts', sa.Column('phone_key', sa.String(length=20), nullable=True))
+    op.add_column('contacts', sa.Column('name_key', sa.String(length=100), nullable=True))
+    op.create_index('ix_contacts_user_id_email_key', 'contacts', ['user_id', 'email_key'], unique=False)
+    op.create_index('ix_contacts_user_id_name_key', 'contacts', ['user_id', 'name_key'], unique=False)
+    op.create_index('ix_contacts_user_id_phone_key', 'contacts', ['user_id', 'phone_key'], unique=False)
+    # ### end Alembic commands ###
+    if not op.get_context().as_sql:
+        backfill()
+
+
+def downgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index('ix_contacts_user_id_phone_key', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_name_key', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_email_key', table_name='contacts')
+    op.drop_column('contacts', 'name_key')
+    op.drop_column('contacts', 'phone_key')
+    op.drop_column('contacts', 'email_key')
+    # ### end Alembic commands ###
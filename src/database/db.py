@@ -1,6 +1,10 @@
+from functools import lru_cache
+from typing import Tuple
+
 from fastapi import HTTPException, status
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 
 from src.conf.config import settings
@@ -9,9 +13,43 @@ from src.conf.config import settings
 
 URI = settings.sqlalchemy_database_url
 
-engine = create_engine(URI, echo=True)
+session_factory = sessionmaker(autocommit=False, autoflush=False)
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """
+    The get_engine function creates the engine the first time it is needed, so importing this module
+    does not load the database driver.
+
+    :return: The engine shared by the process
+    """
+    return create_engine(URI, echo=True)
+
+
+@lru_cache(maxsize=None)
+def get_replica_engines() -> Tuple[Engine, ...]:
+    """
+    The get_replica_engines function creates an engine for every read replica in settings.sqlalchemy_replica_urls.
+    Connections are pinged when they are checked out, so a replica that went away is noticed before a query.
+
+    :return: The replica engines, empty if no replicas are configured
+    """
+    return tuple(create_engine(url, pool_pre_ping=True) for url in settings.sqlalchemy_replica_urls)
+
+
+def SessionLocal(**kwargs) -> Session:
+    """
+    The SessionLocal function opens a new session bound to the engine of src.services.resources,
+    so the pool that is drained and disposed at shutdown is the one the sessions use.
+
+    :param kwargs: Options of the session that differ from the defaults, e.g. expire_on_commit
+    :return: A new session
+    """
+    # imported here because the resources module builds its engine with get_engine from this one
+    from src.services.resources import resources
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return session_factory(bind=resources.engine, **kwargs)
 
 
 def get_db():
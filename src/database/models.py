@@ -1,6 +1,6 @@
 from datetime import date, datetime
 
-from sqlalchemy import Column, Integer, String, Date, DateTime, func, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Date, DateTime, func, ForeignKey, Boolean, Index, JSON
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -14,18 +14,68 @@ class User(Base):
     email_confirm = Column(Boolean, default=False)
     password = Column(String(255), nullable=False)
     avatar = Column(String(255), nullable=True)
-    refresh_token = Column(String(255), nullable=True)
+    avatar_hash = Column(String(64), nullable=True)
     password_reset_token = Column(String(255), nullable=True)
+    # emails are stored lowercased and looked up by lower(email), which this index answers
+    __table_args__ = (Index('ix_users_email_lower', func.lower(email), unique=True),)
 
 class Contact(Base):
     __tablename__ = 'contacts'
     id = Column(Integer, primary_key=True)
     first_name = Column(String(50), nullable=False, index=True)
     last_name = Column(String(50), nullable=False, index=True)
-    email = Column(String(50), nullable=False, index=True)
+    email = Column(String(50), nullable=False)
     phone_number = Column(String(20), nullable=False)
+    phone_e164 = Column(String(16), nullable=True)
     birthday = Column(Date, nullable=True, default=date(year=1900, month=1, day=1))
     address = Column(String(200), nullable=True)
     created_at = Column(DateTime, default=func.now())
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     user = relationship('User', backref='contacts')
+    email_key = Column(String(150), nullable=True)
+    name_key = Column(String(100), nullable=True)
+    # On Postgres the table is hash partitioned by user_id (migration 31f71d8cb4ce). Including user_id in the
+    # identity makes the UPDATE and DELETE statements of the ORM filter by it, so they touch one partition.
+    __mapper_args__ = {'primary_key': [id, user_id]}
+    __table_args__ = (Index('ix_contacts_user_id_email_lower', user_id, func.lower(email)),
+                      Index('ix_contacts_user_id_email_key', 'user_id', 'email_key'),
+                      Index('ix_contacts_user_id_phone_e164', 'user_id', 'phone_e164'),
+                      Index('ix_contacts_user_id_name_key', 'user_id', 'name_key'))
+
+
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(30), nullable=False)
+    email = Column(String(150), nullable=False, index=True)
+    username = Column(String(50), nullable=True)
+    host = Column(String(255), nullable=False)
+    # data the email is rendered from when it is not looked up at send time, e.g. the contacts of a digest
+    payload = Column(JSON, nullable=True)
+    status = Column(String(10), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(255), nullable=True)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+    __table_args__ = (Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+
+class AvatarJob(Base):
+    __tablename__ = 'avatar_jobs'
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String(10), nullable=False, default='pending')
+    avatar = Column(String(255), nullable=True)
+    error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class UserSession(Base):
+    __tablename__ = 'user_sessions'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete='CASCADE'), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=func.now())
@@ -1,9 +1,28 @@
 from datetime import date, timedelta
 
+from sqlalchemy import func, or_, select
 from sqlalchemy.orm import Session
 
 from src.database.models import Contact
 from src.schemas import ContactModel
+from src.services.duplicates import KEYS, blocking_keys
+
+EMPTY_BIRTHDAY = date(year=1900, month=1, day=1)
+MERGED_FIELDS = ('email', 'phone_number', 'birthday', 'address')
+
+
+def set_blocking_keys(contact: Contact):
+    """
+    The set_blocking_keys function stores the normalized keys duplicates are looked up by,
+    among them the phone number in E.164 that reverse phone lookups use too.
+    It is called whenever the name, email or phone of a contact is written.
+
+    :param contact: Contact: The contact to update
+    :return: None
+    """
+    keys = blocking_keys(contact.first_name, contact.last_name, contact.email, contact.phone_number)
+    for key, value in keys.items():
+        setattr(contact, key, value)
 
 
 async def get_contacts(skip, limit, user: int, db: Session):
@@ -65,7 +84,7 @@ async def search_contact(db: Session, user: int, first_name=None, last_name=None
     if first_name:
         contacts = db.query(Contact).filter_by(first_name=first_name.capitalize(), user_id=user).all()
     if email:
-        contacts = db.query(Contact).filter_by(email=email.lower(), user_id=user).all()
+        contacts = db.query(Contact).filter(Contact.user_id == user, func.lower(Contact.email) == email.lower()).all()
 
     return contacts
 
@@ -82,11 +101,12 @@ async def add_contact(body: ContactModel, user: int, db: Session):
     """
     contact = Contact(first_name=body.first_name.capitalize(),
                       last_name=body.last_name.capitalize(),
-                      email=body.email,
+                      email=body.email.lower(),
                       phone_number=body.phone_number,
                       birthday=body.birthday,
                       address=body.address,
                       user_id=user)
+    set_blocking_keys(contact)
 
     db.add(contact)
     db.commit()
@@ -113,8 +133,10 @@ async def change_contact(contact_id, body, user: int, db: Session):
         contact.first_name = body.first_name
         contact.last_name = body.last_name
         contact.birthday = body.birthday
-        contact.email = body.email
+        contact.email = body.email.lower()
+        contact.phone_number = body.phone_number
         contact.address = body.address
+        set_blocking_keys(contact)
         db.commit()
     return contact
 
@@ -139,6 +161,19 @@ async def remove_contact(contact_id, user: int, db: Session):
     return contact
 
 
+async def get_contacts_by_phone(phone_e164: str, user: int, db: Session):
+    """
+    The get_contacts_by_phone function returns the contacts of the user with the given phone number.
+    It is a single probe of the (user_id, phone_e164) index.
+
+    :param phone_e164: str: The phone number in E.164
+    :param user: int: Filter the contacts by user_id
+    :param db: Session: Pass the database session to the function
+    :return: A list of contacts
+    """
+    return db.query(Contact).filter_by(user_id=user, phone_e164=phone_e164).all()
+
+
 async def get_birthdays(user: int, db: Session):
     """
     The get_birthdays function takes in a user id and a database session. It then queries the database for all contacts
@@ -159,3 +194,51 @@ async def get_birthdays(user: int, db: Session):
                     year=today.year) <= today + delta:
                 contacts.append(contact)
     return contacts
+
+
+async def get_duplicate_candidates(user: int, db: Session):
+    """
+    The get_duplicate_candidates function returns the contacts of the user that share a blocking key
+    with another of their contacts. Each key is grouped over its (user_id, key) index, so the cost grows
+    with the number of contacts, not with the number of pairs.
+
+    :param user: int: Filter the contacts by user_id
+    :param db: Session: Pass the database session to the function
+    :return: A list of contacts
+    """
+    conditions = []
+    for key in KEYS:
+        column = getattr(Contact, key)
+        repeated = select(column).where(Contact.user_id == user, column.isnot(None)) \
+            .group_by(column).having(func.count() > 1)
+        conditions.append(column.in_(repeated))
+    return db.query(Contact).filter(Contact.user_id == user, or_(*conditions)).order_by(Contact.id).all()
+
+
+async def merge_contacts(keep_id: int, contact_ids, user: int, db: Session):
+    """
+    The merge_contacts function merges duplicates into one contact. Fields that are empty on the kept
+    contact are filled in from the others, in the order of their ids, and the others are deleted.
+
+    :param keep_id: int: The id of the contact to keep
+    :param contact_ids: The ids of the contacts to merge into it
+    :param user: int: Filter the contacts by user_id
+    :param db: Session: Pass the database session to the function
+    :return: The kept contact, or None if one of the contacts does not exist
+    """
+    ids = set(contact_ids) - {keep_id}
+    contacts = {contact.id: contact for contact in
+                db.query(Contact).filter(Contact.user_id == user, Contact.id.in_(ids | {keep_id})).all()}
+    if len(contacts) != len(ids) + 1:
+        return None
+    keep = contacts[keep_id]
+    for contact_id in sorted(ids):
+        other = contacts[contact_id]
+        for field in MERGED_FIELDS:
+            if getattr(keep, field) in (None, '', EMPTY_BIRTHDAY):
+                setattr(keep, field, getattr(other, field))
+        db.delete(other)
+    set_blocking_keys(keep)
+    db.commit()
+    db.refresh(keep)
+    return keep
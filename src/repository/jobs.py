@@ -0,0 +1,51 @@
+import uuid
+
+from sqlalchemy.orm import Session
+
+from src.database.models import AvatarJob
+
+
+async def create_avatar_job(user: int, db: Session, status: str = 'pending', avatar: str = None):
+    """
+    The create_avatar_job function registers a new avatar upload for the user. The caller commits it.
+
+    :param user: int: The id of the user who uploads the avatar
+    :param db: Session: Pass the database session to the function
+    :param status: str: The initial status, 'done' for an upload that needs no transfer
+    :param avatar: str: The avatar url of a job that is already done
+    :return: The new job
+    """
+    job = AvatarJob(id=uuid.uuid4().hex, user_id=user, status=status, avatar=avatar)
+    db.add(job)
+    return job
+
+
+async def get_avatar_job(job_id: str, user: int, db: Session):
+    """
+    The get_avatar_job function returns the user's avatar job with the given id.
+
+    :param job_id: str: The id of the job
+    :param user: int: Filter the job by user_id
+    :param db: Session: Pass the database session to the function
+    :return: The job or None
+    """
+    job = db.query(AvatarJob).filter_by(id=job_id, user_id=user).first()
+    return job
+
+
+async def update_avatar_job(job: AvatarJob, status: str, db: Session, avatar: str = None, error: str = None):
+    """
+    The update_avatar_job function sets the new status of a job, with the resulting url or the error.
+    The caller commits it.
+
+    :param job: AvatarJob: The job to update
+    :param status: str: One of pending, running, done, failed
+    :param db: Session: Pass the database session to the function
+    :param avatar: str: The url of the uploaded avatar
+    :param error: str: Why the upload failed
+    :return: The job
+    """
+    job.status = status
+    job.avatar = avatar
+    job.error = error[:255] if error else None
+    return job
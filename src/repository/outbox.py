@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from src.database.models import EmailOutbox
+
+
+async def enqueue_email(kind: str, email: str, username: str, host: str, db: Session, payload: dict = None):
+    """
+    The enqueue_email function stores an email to be sent by the outbox worker.
+    Repeated requests for the same address and kind are merged into the email that is still pending.
+    The entry is committed together with the rest of the request.
+
+    :param kind: str: Which email to send, a key of src.services.email.EMAIL_KINDS
+    :param email: str: The recipient's email address
+    :param username: str: The recipient's username, used in the template
+    :param host: str: The base url used to build links in the email
+    :param db: Session: Pass the database session to the function
+    :param payload: dict: The data the email is rendered from, if any
+    :return: The pending outbox entry
+    """
+    message = db.query(EmailOutbox).filter_by(kind=kind, email=email, status='pending').first()
+    if message:
+        message.username = username
+        message.host = host
+        message.payload = payload
+    else:
+        message = EmailOutbox(kind=kind, email=email, username=username, host=host, payload=payload)
+        db.add(message)
+    return message
+
+
+async def enqueue_emails(kind: str, messages: List[dict], host: str, key: str, db: Session):
+    """
+    The enqueue_emails function stores a batch of emails of one kind, at most one per address and value of
+    payload[key], whatever the status of the email stored before. An email that is still pending is updated,
+    one that was already sent or has failed is left alone. The existing emails of the whole batch are looked
+    up in one query. The entries are committed by the caller.
+
+    :param kind: str: Which email to send, a key of src.services.email.EMAIL_KINDS
+    :param messages: List[dict]: The emails, each with the email, username and payload keys
+    :param host: str: The base url used to build links in the emails
+    :param key: str: The payload key that tells the emails to one address apart, e.g. the date of a digest
+    :param db: Session: Pass the database session to the function
+    :return: The number of newly queued emails
+    """
+    existing = {(message.email, message.payload[key]): message for message in db.query(EmailOutbox).filter(
+        EmailOutbox.kind == kind,
+        EmailOutbox.email.in_({message['email'] for message in messages}),
+        EmailOutbox.payload[key].as_string().in_({message['payload'][key] for message in messages}))}
+    queued = 0
+    for message in messages:
+        entry = existing.get((message['email'], message['payload'][key]))
+        if entry is None:
+            db.add(EmailOutbox(kind=kind, email=message['email'], username=message['username'], host=host,
+                               payload=message['payload']))
+            queued += 1
+        elif entry.status == 'pending':
+            entry.username = message['username']
+            entry.host = host
+            entry.payload = message['payload']
+    return queued
+
+
+async def get_pending_emails(limit: int, db: Session):
+    """
+    The get_pending_emails function returns a batch of emails that are due to be sent, oldest first.
+    Emails claimed by a worker whose claim has expired, e.g. because the worker died, are due again.
+    On Postgres the rows are locked with SKIP LOCKED, so several workers can drain the outbox at once.
+
+    :param limit: int: The size of the batch
+    :param db: Session: Pass the database session to the function
+    :return: A list of outbox entries
+    """
+    messages = db.query(EmailOutbox) \
+        .filter(EmailOutbox.status.in_(('pending', 'sending')), EmailOutbox.next_attempt_at <= datetime.utcnow()) \
+        .order_by(EmailOutbox.next_attempt_at) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    return messages
+
+
+async def claim_emails(limit: int, timeout: float, db: Session):
+    """
+    The claim_emails function takes a batch of due emails for this worker by marking them as being sent.
+    The claim is committed by the caller right away, so the rows are not locked while the emails are sent.
+    If the worker does not record the outcome within the timeout, the emails are due again.
+
+    :param limit: int: The size of the batch
+    :param timeout: float: Seconds after which the claim expires
+    :param db: Session: Pass the database session to the function
+    :return: A list of outbox entries
+    """
+    messages = await get_pending_emails(limit, db)
+    expires_at = datetime.utcnow() + timedelta(seconds=timeout)
+    for message in messages:
+        message.status = 'sending'
+        message.next_attempt_at = expires_at
+    return messages
+
+
+async def mark_sent(message: EmailOutbox, db: Session):
+    """
+    The mark_sent function marks an outbox entry as delivered. The change is committed by the caller.
+
+    :param message: EmailOutbox: The delivered entry
+    :param db: Session: Pass the database session to the function
+    :return: The outbox entry
+    """
+    message.status = 'sent'
+    message.attempts += 1
+    message.sent_at = datetime.utcnow()
+    return message
+
+
+async def mark_failed(message: EmailOutbox, error: str, max_attempts: int, backoff: float, db: Session):
+    """
+    The mark_failed function schedules a retry with exponential backoff, or gives up after max_attempts.
+    The change is committed by the caller.
+
+    :param message: EmailOutbox: The entry that could not be delivered
+    :param error: str: The error to keep for diagnostics
+    :param max_attempts: int: How many attempts are made before the entry is marked as failed
+    :param backoff: float: Delay in seconds before the first retry, doubled on every next one
+    :param db: Session: Pass the database session to the function
+    :return: The outbox entry
+    """
+    message.attempts += 1
+    message.last_error = error[:255]
+    if message.attempts >= max_attempts:
+        message.status = 'failed'
+    else:
+        message.status = 'pending'
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff * 2 ** (message.attempts - 1))
+    return message
@@ -0,0 +1,84 @@
+import hashlib
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from src.database.models import UserSession
+
+
+def hash_token(token: str) -> str:
+    """
+    The hash_token function returns the sha256 of a refresh token. Only the hash is stored,
+    so a leaked table does not leak usable tokens.
+
+    :param token: str: The refresh token
+    :return: The hex digest of the token
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def add_session(user: int, refresh_token: str, expires_at: datetime, db: Session):
+    """
+    The add_session function stores a new login session. A user can have any number of sessions,
+    one per device. The caller commits it.
+
+    :param user: int: The id of the user who logged in
+    :param refresh_token: str: The refresh token issued for the session
+    :param expires_at: datetime: When the refresh token expires
+    :param db: Session: Pass the database session to the function
+    :return: The new session
+    """
+    session = UserSession(user_id=user, token_hash=hash_token(refresh_token), expires_at=expires_at)
+    db.add(session)
+    return session
+
+
+async def get_session(refresh_token: str, db: Session):
+    """
+    The get_session function finds a live session by its refresh token with one unique index probe.
+
+    :param refresh_token: str: The refresh token presented by the client
+    :param db: Session: Pass the database session to the function
+    :return: The session or None if it is unknown or expired
+    """
+    session = db.query(UserSession) \
+        .filter(UserSession.token_hash == hash_token(refresh_token), UserSession.expires_at > datetime.utcnow()) \
+        .first()
+    return session
+
+
+async def revoke_session(session: UserSession, db: Session):
+    """
+    The revoke_session function ends one session. The caller commits it.
+
+    :param session: UserSession: The session to end
+    :param db: Session: Pass the database session to the function
+    :return: None
+    """
+    db.delete(session)
+
+
+async def revoke_user_sessions(user: int, db: Session):
+    """
+    The revoke_user_sessions function ends every session of a user, e.g. when a refresh token is reused.
+    The caller commits it.
+
+    :param user: int: The id of the user
+    :param db: Session: Pass the database session to the function
+    :return: The number of ended sessions
+    """
+    return db.query(UserSession).filter(UserSession.user_id == user).delete(synchronize_session=False)
+
+
+async def delete_expired_sessions(user: int, db: Session):
+    """
+    The delete_expired_sessions function removes the user's sessions whose refresh token has expired.
+    The caller commits it.
+
+    :param user: int: The id of the user
+    :param db: Session: Pass the database session to the function
+    :return: The number of removed sessions
+    """
+    return db.query(UserSession) \
+        .filter(UserSession.user_id == user, UserSession.expires_at <= datetime.utcnow()) \
+        .delete(synchronize_session=False)
@@ -1,4 +1,4 @@
-from libgravatar import Gravatar
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from src.database.models import User
@@ -9,13 +9,14 @@ async def get_user_by_email(email, db):
     """
     The get_user_by_email function takes in an email and a database connection.
     It then queries the User table for a user with that email address, returning the first result.
+    The match ignores case and is a probe of the lower(email) index.
 
     :param email: Find the user in the database
     :param db: Connect to the database
     :return: The user object associated with the email address passed in
     :doc-author: Trelent
     """
-    user = db.query(User).filter(User.email == email).first()
+    user = db.query(User).filter(func.lower(User.email) == func.lower(email)).first()
     return user
 
 
@@ -37,6 +38,8 @@ async def get_user_by_id(userid, db):
 async def add_user(body: UserModel, db):
     """
     The add_user function creates a new user in the database.
+    The avatar is left empty, the gravatar default is filled in when the user is serialized.
+    The insert is flushed to get the id, committing is left to the caller.
 
     :param body: UserModel: Define the type of data that is expected to be passed into this function
     :param db: Pass in the database connection
@@ -45,34 +48,14 @@ async def add_user(body: UserModel, db):
     """
     user = User(
         username=body.username,
-        email=body.email,
+        email=body.email.lower(),
         password=body.password,
-        avatar=Gravatar(body.email).get_image()
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    db.flush()
     return user
 
 
-async def update_token(user: User, refresh_token, db: Session):
-    """
-    The update_token function updates the refresh token for a user in the database.
-    Args:
-    user (User): The User object to update.
-    refresh_token (str): The new refresh token to store in the database.
-    db (Session): A connection to our Postgres database.
-
-    :param user: User: Identify the user that is being updated
-    :param refresh_token: Update the user's refresh token in the database
-    :param db: Session: Access the database
-    :return: The user object
-    :doc-author: Trelent
-    """
-    user.refresh_token = refresh_token
-    db.commit()
-
-
 async def update_reset_token(user: User, reset_token: str, db: Session):
     """
     The update_reset_token function updates the password reset token for a user.
@@ -88,7 +71,6 @@ async def update_reset_token(user: User, reset_token: str, db: Session):
     :doc-author: Trelent
     """
     user.password_reset_token = reset_token
-    db.commit()
 
 async def update_password(user: User, new_password: str, db: Session):
     """
@@ -102,7 +84,6 @@ async def update_password(user: User, new_password: str, db: Session):
     :doc-author: Trelent
     """
     user.password = new_password
-    db.commit()
 
 
 async def verify_email(user: User, db: Session):
@@ -117,19 +98,19 @@ async def verify_email(user: User, db: Session):
     :doc-author: Trelent
     """
     user.email_confirm = True
-    db.commit()
 
 
-async def update_avatar(user: User, url: str, db: Session) -> User:
+async def update_avatar(user: User, url: str, db: Session, avatar_hash: str = None) -> User:
     """
     The update_avatar function updates the avatar of a user.
 
     :param user: User: Pass the user object to the function
     :param url: str: Pass in the url of the avatar to be updated
     :param db: Session: Pass the database session to the function
+    :param avatar_hash: str: The sha256 of the uploaded image, used to skip identical uploads
     :return: The user object
     :doc-author: Trelent
     """
     user.avatar = url
-    db.commit()
+    user.avatar_hash = avatar_hash
     return user
@@ -1,29 +1,27 @@
-from fastapi import Depends, HTTPException, status, APIRouter, Security, BackgroundTasks, Request
+from fastapi import Depends, HTTPException, status, APIRouter, Security, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
 from src.database.db import get_db
 from src.schemas import UserModel, UserResponse, Token, RequestEmail, ResetPassword
 from src.repository import user as repository_user
-from src.services.auth import AuthPassword, AuthToken
-from src.services.email import send_email, pass_reset_email
+from src.repository import outbox as repository_outbox
+from src.repository import sessions as repository_sessions
+from src.services.auth import authpassword, authtoken
 
 router = APIRouter(prefix="/auth", tags=['auth'])
 security = HTTPBearer()
-authpassword = AuthPassword()
-authtoken = AuthToken()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED,
              description='Create new user')
-async def sign_up(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def sign_up(body: UserModel, request: Request, db: Session = Depends(get_db)):
     """
     The sign_up function creates a new user in the database.
     It takes a UserModel object as input, and returns the newly created user.
     If an email is already in use, it raises an HTTP 409 Conflict error.
 
     :param body: UserModel: Get the data from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the server
     :param db: Session: Get the database session
     :return: A usermodel object
@@ -33,9 +31,10 @@ async def sign_up(body: UserModel, background_tasks: BackgroundTasks, request: R
     if check_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='This email is already in use')
 
-    body.password = authpassword.get_hash_password(body.password)
+    body.password = await authpassword.hash_password(body.password)
     new_user = await repository_user.add_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
+    await repository_outbox.enqueue_email('confirm_email', new_user.email, new_user.username, str(request.base_url), db)
+    db.commit()
     return new_user
 
 
@@ -54,14 +53,16 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
     user = await repository_user.get_user_by_email(body.username, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
-    if not authpassword.verify_password(body.password, user.password):
+    if not await authpassword.check_password(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     if not user.email_confirm:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"check {user.email} to Confirm account")
 
     access_token = await authtoken.create_access_token(data={"sub": user.email})
     refresh_token = await authtoken.create_refresh_token(data={"sub": user.email})
-    await repository_user.update_token(user, refresh_token, db)
+    await repository_sessions.delete_expired_sessions(user.id, db)
+    await repository_sessions.add_session(user.id, refresh_token, await authtoken.get_token_expiry(refresh_token), db)
+    db.commit()
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
@@ -71,6 +72,8 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
     The refresh_token function is used to refresh the access token.
     The function takes in a refresh token and returns a new access_token,
     refresh_token, and the type of token (bearer).
+    The session of the old refresh token is replaced by a new one. A token that has no session
+    (e.g. one that was already used) ends all sessions of the user.
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the header
     :param db: Session: Pass the database session to the function
@@ -80,13 +83,18 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
     token = credentials.credentials
     email = await authtoken.refresh_token_email(token)
     user = await repository_user.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_user.update_token(user, None, db)
+    session = await repository_sessions.get_session(token, db)
+    if user is None or session is None or session.user_id != user.id:
+        if user is not None:
+            await repository_sessions.revoke_user_sessions(user.id, db)
+            db.commit()
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
     access_token = await authtoken.create_access_token(data={"sub": email})
     refresh_token = await authtoken.create_refresh_token(data={"sub": email})
-    await repository_user.update_token(user, refresh_token, db)
+    await repository_sessions.revoke_session(session, db)
+    await repository_sessions.add_session(user.id, refresh_token, await authtoken.get_token_expiry(refresh_token), db)
+    db.commit()
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
@@ -113,12 +121,12 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     if user.email_confirm:
         return {"message": "Your email is already confirmed"}
     await repository_user.verify_email(user, db)
+    db.commit()
     return {"message": "Email confirmed"}
 
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: Session = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that they can click on
     to confirm their email address. The function takes in a RequestEmail object, which contains the
@@ -127,7 +135,6 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     an email containing a link they can click on.
 
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the application
     :param db: Session: Access the database
     :return: A message that the user should check their email for confirmation
@@ -135,23 +142,22 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     """
     user = await repository_user.get_user_by_email(body.email, db)
 
-    if user.confirmed:
+    if user and user.email_confirm:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await repository_outbox.enqueue_email('confirm_email', user.email, user.username, str(request.base_url), db)
+        db.commit()
     return {"message": "Check your email for confirmation."}
 
 
 @router.post('/password_reset')
-async def password_reset(email: str, background_tasks: BackgroundTasks, request: Request,
-                         db: Session = Depends(get_db)):
+async def password_reset(email: str, request: Request, db: Session = Depends(get_db)):
     """
     The password_reset function is used to send a password reset email to the user.
     It takes in an email address and sends a password reset link to that address.
-    The function also requires background_tasks, request, and db as parameters.
+    The function also requires request and db as parameters.
 
     :param email: str: Get the email of the user that wants to reset his password
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the application
     :param db: Session: Get the database session
     :return: A string
@@ -161,7 +167,8 @@ async def password_reset(email: str, background_tasks: BackgroundTasks, request:
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='no user with such email')
 
-    background_tasks.add_task(pass_reset_email, user.email, user.username, request.base_url)
+    await repository_outbox.enqueue_email('reset_password', user.email, user.username, str(request.base_url), db)
+    db.commit()
     return f'Reset instruction was sending to {email}'
 
 
@@ -182,6 +189,7 @@ async def password_reset_email(token: str, db: Session = Depends(get_db)):
     user = await repository_user.get_user_by_email(email, db)
     reset_password_token = await authtoken.create_reset_password_token(data={"sub": user.email})
     await repository_user.update_reset_token(user, reset_password_token, db)
+    db.commit()
     return {'reset_token': reset_password_token}
 
 
@@ -210,7 +218,8 @@ async def password_reset(request: ResetPassword, db: Session = Depends(get_db)):
     if request.new_password != request.confirm_password:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="passwords do not match")
 
-    new_password = authpassword.get_hash_password(request.new_password)
+    new_password = await authpassword.hash_password(request.new_password)
     await repository_user.update_password(user, new_password, db)
     await repository_user.update_reset_token(user, None, db)
+    db.commit()
     return 'password update successfully'
@@ -1,21 +1,28 @@
 from datetime import date
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Path
-from fastapi_limiter.depends import RateLimiter
+import redis
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
 from sqlalchemy.orm import Session
 
 from src.database.db import get_db
-from src.schemas import ContactModel, ContactsResponse
+from src.schemas import ContactModel, ContactsResponse, DuplicateGroup, MergeModel
 from src.repository import contacts as repository_contacts
-from src.services.auth import AuthToken
+from src.conf.config import settings
+from src.services.auth import authtoken
+from src.services.duplicates import find_groups
+from src.services.phone import to_e164
+from src.services.limiter import RateLimiter
+from src.services.replicas import get_read_db, read_router
+from src.services.resources import get_cache
 
 router = APIRouter(prefix='/contacts', tags=["contacts"])
-authtoken = AuthToken()
+rate_limiter = RateLimiter(times=settings.rate_limit_contacts_times, seconds=settings.rate_limit_contacts_seconds,
+                           group='contacts')
 
 
-@router.get('/', response_model=List[ContactsResponse], dependencies=[Depends(RateLimiter(times=2, seconds=5))])
-async def get_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
+@router.get('/', response_model=List[ContactsResponse], dependencies=[Depends(rate_limiter)])
+async def get_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db),
                        user: int = Depends(authtoken.get_current_user)):
     """
     The get_contacts function returns a list of contacts.
@@ -31,9 +38,9 @@ async def get_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(ge
     return contacts
 
 
-@router.post('/', response_model=ContactsResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+@router.post('/', response_model=ContactsResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(rate_limiter)])
 async def add_contact(body: ContactModel, db: Session = Depends(get_db),
-                      user: int = Depends(authtoken.get_current_user)):
+                      user: int = Depends(authtoken.get_current_user), cache: redis.Redis = Depends(get_cache)):
     """
     The add_contact function creates a new contact in the database.
     The function takes a ContactModel object as input, which is validated by Pydantic.
@@ -42,16 +49,18 @@ async def add_contact(body: ContactModel, db: Session = Depends(get_db),
     :param body: ContactModel: Get the data from the request body
     :param db: Session: Pass the database session to the function
     :param user: int: Get the user id from the token
+    :param cache: redis.Redis: Mark the write for read-your-writes
     :return: A contactmodel object
     :doc-author: Trelent
     """
     contact = await repository_contacts.add_contact(body, user, db)
+    read_router.record_write(user, cache)
     return contact
 
 
-@router.get('/search', response_model=List[ContactsResponse], dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+@router.get('/search', response_model=List[ContactsResponse], dependencies=[Depends(rate_limiter)])
 async def search_contact(first_name: str = None, last_name: str = None, email: str = None,
-                         db: Session = Depends(get_db), user: int = Depends(authtoken.get_current_user)):
+                         db: Session = Depends(get_read_db), user: int = Depends(authtoken.get_current_user)):
     """
     The search_contact function searches for a contact in the database.
     It takes three parameters: first_name, last_name and email.
@@ -71,8 +80,63 @@ async def search_contact(first_name: str = None, last_name: str = None, email: s
     return contacts
 
 
-@router.get('/birthdays', response_model=List[ContactsResponse], dependencies=[Depends(RateLimiter(times=2, seconds=5))])
-async def get_birthdays(db: Session = Depends(get_db), user: int = Depends(authtoken.get_current_user)):
+@router.get('/duplicates', response_model=List[DuplicateGroup], dependencies=[Depends(rate_limiter)])
+async def get_duplicates(min_score: float = Query(default=0.0, ge=0, le=1), db: Session = Depends(get_read_db),
+                         user: int = Depends(authtoken.get_current_user)):
+    """
+    The get_duplicates function returns the groups of contacts that look like the same person.
+    Candidates share a normalized email, phone number or name, and every group is scored from 0 to 1
+    by how many of those match.
+
+    :param min_score: float: Leave out groups with a lower score
+    :param db: Session: Get the database session
+    :param user: int: Get the user id from the authtoken
+    :return: A list of duplicate groups, best first
+    """
+    contacts = await repository_contacts.get_duplicate_candidates(user, db)
+    return find_groups(contacts, min_score)
+
+
+@router.post('/duplicates/merge', response_model=ContactsResponse, dependencies=[Depends(rate_limiter)])
+async def merge_duplicates(body: MergeModel, db: Session = Depends(get_db),
+                           user: int = Depends(authtoken.get_current_user), cache: redis.Redis = Depends(get_cache)):
+    """
+    The merge_duplicates function merges the contacts in body.merge into the contact body.keep.
+    Empty fields of the kept contact are filled in from the merged ones, which are deleted.
+
+    :param body: MergeModel: The contact to keep and the contacts to merge into it
+    :param db: Session: Get the database session
+    :param user: int: Get the user id from the authtoken
+    :param cache: redis.Redis: Mark the write for read-your-writes
+    :return: The merged contact
+    """
+    contact = await repository_contacts.merge_contacts(body.keep, body.merge, user, db)
+    if contact is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    read_router.record_write(user, cache)
+    return contact
+
+
+@router.get('/by-phone/{number}', response_model=List[ContactsResponse], dependencies=[Depends(rate_limiter)])
+async def get_contacts_by_phone(number: str, db: Session = Depends(get_read_db),
+                                user: int = Depends(authtoken.get_current_user)):
+    """
+    The get_contacts_by_phone function answers who is calling: it returns the contacts with the given number.
+    The number may be written in any format, it is normalized to E.164 like the stored numbers.
+
+    :param number: str: The phone number, e.g. +380671234567 or 067-123-45-67
+    :param db: Session: Get the database session
+    :param user: int: Get the user id from the authtoken
+    :return: A list of contacts
+    """
+    phone_e164 = to_e164(number)
+    if phone_e164 is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid phone number")
+    return await repository_contacts.get_contacts_by_phone(phone_e164, user, db)
+
+
+@router.get('/birthdays', response_model=List[ContactsResponse], dependencies=[Depends(rate_limiter)])
+async def get_birthdays(db: Session = Depends(get_read_db), user: int = Depends(authtoken.get_current_user)):
     """
     The get_birthdays function returns a list of contacts with birthdays in the next week.
     The user is determined by the authtoken passed to it.
@@ -88,9 +152,9 @@ async def get_birthdays(db: Session = Depends(get_db), user: int = Depends(autht
     return contacts
 
 
-@router.delete('/{contact_id}', status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+@router.delete('/{contact_id}', status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(rate_limiter)])
 async def remove_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
-                         user: int = Depends(authtoken.get_current_user)):
+                         user: int = Depends(authtoken.get_current_user), cache: redis.Redis = Depends(get_cache)):
     """
     The remove_contact function removes a contact from the database.
     The function takes in an integer representing the id of the contact to be removed,
@@ -99,18 +163,20 @@ async def remove_contact(contact_id: int = Path(ge=1), db: Session = Depends(get
     :param contact_id: int: Get the contact id from the path
     :param db: Session: Get the database session
     :param user: int: Get the user id from the authtoken
+    :param cache: redis.Redis: Mark the write for read-your-writes
     :return: The contact that was removed
     :doc-author: Trelent
     """
     contact = await repository_contacts.remove_contact(contact_id, user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    read_router.record_write(user, cache)
     return contact
 
 
-@router.put('/{contact_id}', response_model=ContactsResponse, dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+@router.put('/{contact_id}', response_model=ContactsResponse, dependencies=[Depends(rate_limiter)])
 async def change_contact(body: ContactModel, contact_id: int = Path(ge=1), db: Session = Depends(get_db),
-                         user: int = Depends(authtoken.get_current_user)):
+                         user: int = Depends(authtoken.get_current_user), cache: redis.Redis = Depends(get_cache)):
     """
     The change_contact function is used to change a contact in the database.
     The function takes in a ContactModel object, which contains all of the information for the new contact.
@@ -121,6 +187,7 @@ async def change_contact(body: ContactModel, contact_id: int = Path(ge=1), db: S
     :param contact_id: int: Specify the contact id of the contact to be deleted
     :param db: Session: Get the database session
     :param user: int: Get the user id from the token
+    :param cache: redis.Redis: Mark the write for read-your-writes
     :return: A contactmodel
     :doc-author: Trelent
     """
@@ -129,11 +196,12 @@ async def change_contact(body: ContactModel, contact_id: int = Path(ge=1), db: S
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
 
     contact = await repository_contacts.change_contact(contact_id, body, user, db)
+    read_router.record_write(user, cache)
     return contact
 
 
-@router.get('/{contact_id}', response_model=ContactsResponse, dependencies=[Depends(RateLimiter(times=2, seconds=5))])
-async def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+@router.get('/{contact_id}', response_model=ContactsResponse, dependencies=[Depends(rate_limiter)])
+async def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_read_db),
                       user: int = Depends(authtoken.get_current_user)):
     """
     The get_contact function returns a contact by its id.
@@ -1,21 +1,20 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status, UploadFile, File
 from sqlalchemy.orm import Session
 
 
 from src.database.db import get_db
+from src.repository import jobs as repository_jobs
 from src.repository import user as repository_users
-from src.services.auth import AuthToken
-from src.schemas import UserResponse
-from src.services.cloudinary import CloudImage
+from src.services.auth import authtoken
+from src.schemas import UserResponse, AvatarJobResponse
+from src.services.avatar import avatar_uploader
+from src.services.replicas import get_read_db
 
-cloud_image = CloudImage()
-
-authtoken = AuthToken()
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/me/", response_model=UserResponse)
-async def read_users_me(current_user: int = Depends(authtoken.get_current_user), db: Session = Depends(get_db) ):
+async def read_users_me(current_user: int = Depends(authtoken.get_current_user), db: Session = Depends(get_read_db)):
     """
     The read_users_me function is a GET request that returns the user's information.
     The current_user parameter is an integer value that represents the user's ID.
@@ -29,23 +28,50 @@ async def read_users_me(current_user: int = Depends(authtoken.get_current_user),
     return await repository_users.get_user_by_id(current_user, db)
 
 
-@router.patch('/avatar', response_model=UserResponse)
-async def update_avatar_user(file: UploadFile = File(), current_user: int = Depends(authtoken.get_current_user),
-                             db: Session = Depends(get_db)):
+@router.patch('/avatar', response_model=AvatarJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def update_avatar_user(background_tasks: BackgroundTasks, response: Response, file: UploadFile = File(),
+                             current_user: int = Depends(authtoken.get_current_user), db: Session = Depends(get_db)):
     """
-    The update_avatar_user function updates the avatar of a user.
-    The function takes in an UploadFile object, which is a file that has been uploaded to the server.
-    It also takes in the current_user and db objects as dependencies.
+    The update_avatar_user function accepts a new avatar for the user.
+    The file is spooled to a temporary file and the upload to the image storage runs as a background task,
+    so the request returns right away with a job that can be polled at /users/avatar/{job_id}.
+    The write is recorded for read-your-writes by the background task, once the new avatar is committed.
+    Re-uploading the current avatar is detected by its content hash and finishes at once without a transfer.
 
+    :param background_tasks: BackgroundTasks: Run the upload after the response is sent
+    :param response: Response: Switch to 200 when the upload is a no-op
     :param file: UploadFile: Get the file from the request
     :param current_user: int: Get the current user's id
     :param db: Session: Get the database session
-    :return: The user object that has been updated with the new avatar
-    :doc-author: Trelent
+    :return: The pending upload job
     """
+    path, digest = await avatar_uploader.save(file)
     user = await repository_users.get_user_by_id(current_user, db)
-    route = cloud_image.get_name(user.email)
-    r = cloud_image.upload(file.file, route)
-    src_url = cloud_image.get_url_for_avatar(route, r)
-    user = await repository_users.update_avatar(user, src_url, db)
-    return user
+    if user.avatar_hash == digest:
+        await avatar_uploader.discard(path)
+        response.status_code = status.HTTP_200_OK
+        job = await repository_jobs.create_avatar_job(current_user, db, status='done', avatar=user.avatar)
+        db.commit()
+        return job
+
+    job = await repository_jobs.create_avatar_job(current_user, db)
+    db.commit()
+    background_tasks.add_task(avatar_uploader.process, job.id, current_user, path, digest)
+    return job
+
+
+@router.get('/avatar/{job_id}', response_model=AvatarJobResponse)
+async def get_avatar_job(job_id: str, current_user: int = Depends(authtoken.get_current_user),
+                         db: Session = Depends(get_db)):
+    """
+    The get_avatar_job function returns the state of an avatar upload started by the current user.
+
+    :param job_id: str: The id returned by update_avatar_user
+    :param current_user: int: Get the current user's id
+    :param db: Session: Get the database session
+    :return: The upload job
+    """
+    job = await repository_jobs.get_avatar_job(job_id, current_user, db)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return job
@@ -1,5 +1,9 @@
 from datetime import date
-from pydantic import BaseModel, Field, EmailStr
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, EmailStr, validator
+
+from src.services.gravatar import gravatar_url
 
 
 class UserModel(BaseModel):
@@ -12,13 +16,27 @@ class UserResponse(BaseModel):
     id: int
     email: str
     username: str
-    avatar: str
+    avatar: Optional[str]
+
+    @validator('avatar', always=True)
+    def default_avatar(cls, avatar, values):
+        return avatar or gravatar_url(values.get('email', ''))
 
     class Config:
         orm_mode = True
 
 
 
+class AvatarJobResponse(BaseModel):
+    id: str
+    status: str
+    avatar: Optional[str]
+    error: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+
 class ContactModel(BaseModel):
     first_name: str = Field(max_length=50)
     last_name: str = Field(max_length=50)
@@ -30,12 +48,24 @@ class ContactModel(BaseModel):
 
 
 class ContactsResponse(ContactModel):
+    id: int
     user = UserResponse
 
     class Config:
         orm_mode = True
 
 
+class DuplicateGroup(BaseModel):
+    score: float
+    keys: List[str]
+    contacts: List[ContactsResponse]
+
+
+class MergeModel(BaseModel):
+    keep: int
+    merge: List[int] = Field(min_items=1)
+
+
 class Token(BaseModel):
     access_token: str
     refresh_token: str
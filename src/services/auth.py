@@ -1,16 +1,22 @@
+import time
 from datetime import datetime, timedelta
 from typing import Optional
+from uuid import uuid4
 
 from fastapi import HTTPException, Depends, status
 from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import redis
 
 from src.conf.config import settings
 from src.database.db import get_db
 from src.repository import user as repository_user
+from src.services.metrics import BCRYPT_DURATION, BCRYPT_QUEUE, USER_CACHE_HIT, USER_CACHE_MISS
+from src.services.resources import get_cache
+from src.services.tracing import tracer
 
 
 class AuthPassword:
@@ -41,12 +47,42 @@ class AuthPassword:
         """
         return self.pwd_context.verify(password, hashed_password)
 
+    def timed(self, queued_at: float, func, *args):
+        started = time.perf_counter()
+        BCRYPT_QUEUE.observe(started - queued_at)
+        try:
+            return func(*args)
+        finally:
+            BCRYPT_DURATION.observe(time.perf_counter() - started)
+
+    async def hash_password(self, password: str):
+        """
+        The hash_password function hashes the password in the threadpool, so bcrypt does not block the event loop.
+        The time the call waited for a thread is recorded in the bcrypt_queue_seconds metric.
+
+        :param self: Represent the instance of the class
+        :param password: str: The plain-text password
+        :return: A hash of the password
+        """
+        return await run_in_threadpool(self.timed, time.perf_counter(), self.get_hash_password, password)
+
+    async def check_password(self, password: str, hashed_password: str):
+        """
+        The check_password function is verify_password run in the threadpool, like hash_password.
+
+        :param self: Represent the instance of the class
+        :param password: str: The plain-text password
+        :param hashed_password: str: The stored hash
+        :return: A boolean value
+        """
+        return await run_in_threadpool(self.timed, time.perf_counter(), self.verify_password, password,
+                                       hashed_password)
+
 
 class AuthToken:
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/auth/login')
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
@@ -90,7 +126,8 @@ class AuthToken:
         else:
             expire = datetime.utcnow() + timedelta(minutes=30)
 
-        to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'refresh_token'})
+        # jti keeps tokens unique, since every one of them is a separate session
+        to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'refresh_token', 'jti': uuid4().hex})
         refresh_token = jwt.encode(to_encode, self.SECRET_KEY, self.ALGORITHM)
         return refresh_token
 
@@ -117,7 +154,8 @@ class AuthToken:
         reset_password_token = jwt.encode(to_encode, self.SECRET_KEY, self.ALGORITHM)
         return reset_password_token
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db),
+                               cache: redis.Redis = Depends(get_cache)):
         """
         The get_current_user function is a dependency that will be used in the
         get_current_active_user endpoint. It takes a token as an argument and
@@ -127,6 +165,7 @@ class AuthToken:
         :param self: Refer to the class itself
         :param token: str: Get the token from the request header
         :param db: Session: Get the database session
+        :param cache: redis.Redis: The redis client that caches the user ids
         :return: The user id of the currently logged in user
         :doc-author: Trelent
         """
@@ -137,7 +176,8 @@ class AuthToken:
         )
 
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, self.ALGORITHM)
+            with tracer.span('jwt.decode'):
+                payload = jwt.decode(token, self.SECRET_KEY, self.ALGORITHM)
             if payload['scope'] == 'access_token':
                 email = payload['sub']
                 if email is None:
@@ -146,15 +186,19 @@ class AuthToken:
                 raise credentials_exception
         except:
             raise credentials_exception
-        user = self.r.get(email)
+        with tracer.span('redis.get'):
+            user = cache.get(email)
         if user is None:
+            USER_CACHE_MISS.inc()
             user = await repository_user.get_user_by_email(email, db)
             user = user.id
             if user is None:
                 raise credentials_exception
-            self.r.set(email, user)
-            self.r.expire(email, 60)
+            with tracer.span('redis.set'):
+                cache.set(email, user)
+                cache.expire(email, 60)
         else:
+            USER_CACHE_HIT.inc()
             user = user.decode()
         return user
 
@@ -181,6 +225,17 @@ class AuthToken:
 
         return email
 
+    async def get_token_expiry(self, token: str) -> datetime:
+        """
+        The get_token_expiry function returns when a token issued by this class expires.
+
+        :param self: Represent the instance of the class
+        :param token: str: A token created by one of the create_* methods
+        :return: The expiry time in UTC
+        """
+        payload = jwt.get_unverified_claims(token)
+        return datetime.utcfromtimestamp(payload['exp'])
+
     async def reset_token_email(self, reset_token: str = Depends(oauth2_scheme)):
         """
         The reset_token_email function is used to validate the reset password token.
@@ -239,3 +294,7 @@ class AuthToken:
             print(e)
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
+
+
+authpassword = AuthPassword()
+authtoken = AuthToken()
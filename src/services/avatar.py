@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Optional
+
+import redis
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.repository import jobs as repository_jobs
+from src.repository import user as repository_users
+from src.services.cloudinary import AvatarStorage, get_storage
+from src.services.replicas import read_router
+from src.services.resources import resources
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_SIZE = 16
+# room for the multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    The sniff_image_type function recognizes an image by its magic bytes instead of the client's content type.
+
+    :param head: bytes: The first bytes of the file
+    :return: The image type or None
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'avif'
+    return None
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects avatar uploads that are too large while the body is still being received.
+    A declared Content-Length over the limit is refused before reading anything.
+    """
+
+    def __init__(self, app, path: str, max_size: int):
+        self.app = app
+        self.path = path
+        self.limit = max_size + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > self.limit:
+            response = JSONResponse({'detail': 'File too large'}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get('body', b''))
+            if received > self.limit:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='File too large')
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class AvatarUploader:
+    """
+    Moves avatar uploads off the request path. The request only spools the file to a temporary
+    file, while the storage backend does the transfer later without blocking the event loop.
+    """
+
+    def __init__(self, storage: AvatarStorage, session_factory=SessionLocal, chunk_size: int = CHUNK_SIZE,
+                 max_size: int = settings.avatar_max_size):
+        self.storage = storage
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+
+    async def save(self, file: UploadFile):
+        """
+        The save function copies the uploaded file to a temporary file chunk by chunk.
+        Reads and writes run in the threadpool, so a large file does not hold the event loop.
+        The type is checked on the first chunk and the size on every chunk, and the file is hashed on the way.
+        The temporary file is removed if the copy fails for any reason.
+
+        :param self: Represent the instance of the class
+        :param file: UploadFile: The uploaded file
+        :return: The path of the temporary file and the sha256 of its content
+        """
+        sha = hashlib.sha256()
+        size = 0
+        tmp = await run_in_threadpool(tempfile.NamedTemporaryFile, prefix='avatar_', delete=False)
+        try:
+            chunk = await file.read(max(self.chunk_size, SNIFF_SIZE))
+            if sniff_image_type(chunk) is None:
+                raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                    detail='Avatar must be a JPEG, PNG, GIF, WebP or AVIF image')
+            while chunk:
+                size += len(chunk)
+                if size > self.max_size:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='File too large')
+                sha.update(chunk)
+                await run_in_threadpool(tmp.write, chunk)
+                chunk = await file.read(self.chunk_size)
+        except BaseException:
+            # not awaited, so the file is removed even when the request is cancelled mid-upload
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+        await run_in_threadpool(tmp.close)
+        return tmp.name, sha.hexdigest()
+
+    async def discard(self, path: str):
+        await run_in_threadpool(os.remove, path)
+
+    async def process(self, job_id: str, user: int, path: str, digest: str):
+        """
+        The process function uploads the spooled file, updates the user's avatar and records the result
+        in the job. It is meant to run as a background task after the response has been sent.
+        The user's reads go to the primary from the moment the new avatar is committed, not from the upload request.
+
+        :param self: Represent the instance of the class
+        :param job_id: str: The id of the job to update
+        :param user: int: The id of the user who uploaded the avatar
+        :param path: str: The temporary file written by save
+        :param digest: str: The sha256 of the file, stored to detect a repeated upload
+        :return: None
+        """
+        db = self.session_factory()
+        job = None
+        try:
+            job = await repository_jobs.get_avatar_job(job_id, user, db)
+            await repository_jobs.update_avatar_job(job, 'running', db)
+            db.commit()
+            current_user = await repository_users.get_user_by_id(user, db)
+            route = self.storage.get_name(current_user.email)
+            src_url = await self.storage.store(path, route)
+            await repository_users.update_avatar(current_user, src_url, db, avatar_hash=digest)
+            await repository_jobs.update_avatar_job(job, 'done', db, avatar=src_url)
+            db.commit()
+        except Exception as err:
+            db.rollback()
+            if job is not None:
+                await repository_jobs.update_avatar_job(job, 'failed', db, error=str(err))
+                db.commit()
+        else:
+            try:
+                read_router.record_write(user, resources.cache)
+            except redis.RedisError as err:
+                logger.warning('could not record the avatar write of user %s: %s', user, err)
+        finally:
+            db.close()
+            await self.discard(path)
+
+
+avatar_uploader = AvatarUploader(get_storage())
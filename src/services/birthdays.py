@@ -0,0 +1,167 @@
+"""
+Nightly birthday digest. Run it once a day from cron or any other scheduler::
+
+    python -m src.services.birthdays
+
+Upcoming birthdays of all users are read with one query, walked in chunks by (user_id, contact id).
+The rows of each user are collected into a digest and one email per user is queued in the outbox,
+which the outbox worker sends. Every chunk is committed before the next one is read, so memory stays
+bounded by the chunk size however many users there are. A digest is queued once per user and window
+date: running the job again for the same date updates the digests that are still pending and leaves
+the sent ones alone, and a pending digest of an earlier date is sent as it is.
+"""
+import argparse
+import asyncio
+import calendar
+import logging
+import time
+from datetime import date, timedelta
+from itertools import groupby
+from operator import attrgetter
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, extract, or_, select
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.database.models import Contact, User
+from src.repository import outbox as repository_outbox
+from src.repository.contacts import EMPTY_BIRTHDAY
+
+logger = logging.getLogger(__name__)
+
+KIND = 'birthday_digest'
+
+
+def birthday_window(today: date, days: int) -> Dict[int, date]:
+    """
+    The birthday_window function maps the month and day of every date in the window, as month * 100 + day,
+    to that date. In a year without February 29 the birthdays on that day are celebrated on March 1.
+
+    :param today: date: The first day of the window
+    :param days: int: How many days after today the window covers
+    :return: A dict of month * 100 + day to the date in the window
+    """
+    window = {}
+    for offset in range(days + 1):
+        day = today + timedelta(days=offset)
+        window[day.month * 100 + day.day] = day
+        if day.month == 3 and day.day == 1 and not calendar.isleap(day.year):
+            window[229] = day
+    return window
+
+
+class BirthdayDigestJob:
+    """
+    Queues one digest email per user with the contacts whose birthday is within the next days.
+    """
+
+    def __init__(self, session_factory=SessionLocal, days: int = settings.birthday_digest_days,
+                 chunk_size: int = settings.birthday_digest_chunk_size, host: str = settings.app_url):
+        self.session_factory = session_factory
+        self.days = days
+        self.chunk_size = chunk_size
+        self.host = host
+        self.users = 0
+        self.contacts = 0
+        self.queued = 0
+
+    def read_chunk(self, window: Dict[int, date], after: tuple, db: Session):
+        """
+        The read_chunk function reads the next chunk of upcoming birthdays of all users with confirmed emails,
+        ordered by user and contact.
+
+        :param self: Represent the instance of the class
+        :param window: Dict[int, date]: The window computed by birthday_window
+        :param after: tuple: The (user_id, contact id) of the last row of the previous chunk
+        :param db: Session: Pass the database session to the function
+        :return: A list of rows
+        """
+        month_day = extract('month', Contact.birthday) * 100 + extract('day', Contact.birthday)
+        last_user, last_contact = after
+        statement = select(Contact.user_id, Contact.id, Contact.first_name, Contact.last_name, Contact.birthday,
+                           User.email, User.username) \
+            .join(User, User.id == Contact.user_id) \
+            .where(User.email_confirm.is_(True),
+                   Contact.birthday.isnot(None),
+                   Contact.birthday != EMPTY_BIRTHDAY,
+                   month_day.in_(list(window)),
+                   or_(Contact.user_id > last_user, and_(Contact.user_id == last_user, Contact.id > last_contact))) \
+            .order_by(Contact.user_id, Contact.id) \
+            .limit(self.chunk_size)
+        return db.execute(statement).all()
+
+    @staticmethod
+    def digest(rows: list, window: Dict[int, date]) -> dict:
+        """
+        The digest function builds the email of one user from their rows, soonest birthdays first.
+        The payload keeps the first day of the window, which the digests are told apart by.
+
+        :param rows: list: The rows of one user
+        :param window: Dict[int, date]: The window computed by birthday_window
+        :return: A dict with the email, username and payload of the email
+        """
+        contacts = sorted(({'first_name': row.first_name, 'last_name': row.last_name,
+                            'birthday': window[row.birthday.month * 100 + row.birthday.day].isoformat()}
+                           for row in rows), key=lambda contact: contact['birthday'])
+        return {'email': rows[0].email, 'username': rows[0].username,
+                'payload': {'date': min(window.values()).isoformat(), 'contacts': contacts}}
+
+    async def enqueue(self, groups: List[list], window: Dict[int, date], db: Session):
+        messages = [self.digest(rows, window) for rows in groups]
+        self.queued += await repository_outbox.enqueue_emails(KIND, messages, self.host, 'date', db)
+        db.commit()
+        self.users += len(groups)
+        self.contacts += sum(len(rows) for rows in groups)
+
+    async def run(self, today: Optional[date] = None) -> int:
+        """
+        The run function queues the digests of all users, one chunk at a time.
+        The rows of the last user of a chunk may continue in the next chunk, so that user is carried over
+        and queued with the next chunk.
+
+        :param self: Represent the instance of the class
+        :param today: date: The first day of the window, today by default
+        :return: The number of digests of the window
+        """
+        window = birthday_window(today or date.today(), self.days)
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            after = (0, 0)
+            carried: list = []
+            while True:
+                rows = self.read_chunk(window, after, db)
+                if not rows:
+                    break
+                after = (rows[-1].user_id, rows[-1].id)
+                groups = [list(group) for _, group in groupby(carried + rows, key=attrgetter('user_id'))]
+                carried = groups.pop()
+                if groups:
+                    await self.enqueue(groups, window, db)
+                if len(rows) < self.chunk_size:
+                    break
+            if carried:
+                await self.enqueue([carried], window, db)
+        finally:
+            db.close()
+        logger.info('birthday digests: %d users, %d contacts, %d newly queued in %.3fs',
+                    self.users, self.contacts, self.queued, time.perf_counter() - started)
+        return self.users
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Queue the birthday digest emails of all users.')
+    parser.add_argument('--date', type=date.fromisoformat, default=None,
+                        help='first day of the window, YYYY-MM-DD, today by default')
+    parser.add_argument('--days', type=int, default=settings.birthday_digest_days)
+    parser.add_argument('--chunk-size', type=int, default=settings.birthday_digest_chunk_size)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    job = BirthdayDigestJob(days=args.days, chunk_size=args.chunk_size)
+    asyncio.run(job.run(args.date))
+
+
+if __name__ == '__main__':
+    main()
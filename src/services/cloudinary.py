@@ -1,18 +1,21 @@
+import asyncio
 import hashlib
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional, Sequence
 
-import cloudinary
-import cloudinary.uploader
+from starlette.concurrency import run_in_threadpool
+from starlette.staticfiles import StaticFiles
 
 from src.conf.config import settings
 
 
-class CloudImage:
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
+class AvatarStorage(ABC):
+    """
+    Where avatars are kept. A backend takes the path of an uploaded image and returns the url of the avatar.
+    Backends have to implement store; get_name and close have defaults.
+    """
 
     def get_name(self, email):
         """
@@ -26,6 +29,49 @@ class CloudImage:
         """
         return hashlib.sha256(email.encode()).hexdigest()[:8]
 
+    @abstractmethod
+    async def store(self, path: str, route: str) -> str:
+        """
+        The store function saves the image at path as the avatar named route.
+
+        :param self: Represent the instance of the class
+        :param path: str: The uploaded image on the local disk
+        :param route: str: The name returned by get_name
+        :return: The url of the avatar
+        """
+
+    async def close(self):
+        pass
+
+
+class CloudImage(AvatarStorage):
+    """
+    Keeps avatars on cloudinary. The SDK is imported and configured on the first upload,
+    not when the app starts.
+    """
+    configured = False
+
+    @classmethod
+    def configure(cls):
+        """
+        The configure function imports the cloudinary SDK and sets the account credentials, once per process.
+
+        :param cls: Represent the class
+        :return: The cloudinary module
+        """
+        import cloudinary
+        import cloudinary.uploader
+
+        if not cls.configured:
+            cloudinary.config(
+                cloud_name=settings.cloudinary_name,
+                api_key=settings.cloudinary_api_key,
+                api_secret=settings.cloudinary_api_secret,
+                secure=True
+            )
+            cls.configured = True
+        return cloudinary
+
     def upload(self, file, route):
         """
         The upload function takes a file and a route as arguments.
@@ -37,6 +83,7 @@ class CloudImage:
         :return: A dictionary with the following keys:
         :doc-author: Trelent
         """
+        cloudinary = self.configure()
         r = cloudinary.uploader.upload(file, folder='NoteBook', public_id=route, overwrite=True)
         return r
 
@@ -55,6 +102,137 @@ class CloudImage:
         :return: The url for the avatar of a user
         :doc-author: Trelent
         """
+        cloudinary = self.configure()
         src_url = cloudinary.CloudinaryImage(f'NoteBook/{route}') \
             .build_url(width=250, height=250, crop='fill', version=r.get('version'))
         return src_url
+
+    async def store(self, path: str, route: str) -> str:
+        """
+        The store function uploads the image to cloudinary in the threadpool and builds the 250x250 url.
+
+        :param self: Represent the instance of the class
+        :param path: str: The uploaded image on the local disk
+        :param route: str: The name returned by get_name
+        :return: The url of the avatar
+        """
+        r = await run_in_threadpool(self.upload, path, route)
+        return self.get_url_for_avatar(route, r)
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(64 * 1024):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def render_avatar(path: str, directory: str, sizes: Sequence[int], formats: Sequence[str]) -> str:
+    """
+    The render_avatar function crops the image to squares of every size and encodes each in every format.
+    Files are named after the hash of the source, so an existing file never changes and is not rendered twice.
+    It runs in a worker process, which is why it is a plain module-level function.
+
+    :param path: str: The uploaded image
+    :param directory: str: Where the rendered files are written
+    :param sizes: Sequence[int]: Side lengths in pixels, the first one is the main avatar
+    :param formats: Sequence[str]: Pillow format names, the first one is the main avatar
+    :return: The file name of the main avatar
+    """
+    from PIL import Image, ImageOps
+
+    digest = file_digest(path)[:32]
+    names = [[f'{digest}_{size}.{fmt.lower()}' for fmt in formats] for size in sizes]
+    if all(os.path.exists(os.path.join(directory, name)) for row in names for name in row):
+        return names[0][0]
+
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for size, row in zip(sizes, names):
+            thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            for fmt, name in zip(formats, row):
+                target = os.path.join(directory, name)
+                tmp = f'{target}.{os.getpid()}.tmp'
+                thumb.save(tmp, fmt, quality=80)
+                os.replace(tmp, target)
+    return names[0][0]
+
+
+class LocalImageStorage(AvatarStorage):
+    """
+    Keeps avatars on the local disk. Cropping, resizing and encoding are done with Pillow in a process pool,
+    and every avatar is rendered once in several sizes and formats under content-hash file names,
+    so the files can be served with an immutable cache policy.
+    """
+
+    def __init__(self, directory: str, base_url: str, sizes: Sequence[int], formats: Sequence[str],
+                 workers: int = 2, executor: Optional[Executor] = None):
+        self.directory = directory
+        self.base_url = base_url.rstrip('/') + '/'
+        self.sizes = list(sizes)
+        self.formats = self.supported_formats(formats)
+        self.workers = workers
+        self.executor = executor
+
+    @staticmethod
+    def supported_formats(formats: Sequence[str]):
+        """
+        The supported_formats function drops the formats the installed Pillow cannot encode (e.g. AVIF).
+
+        :param formats: Sequence[str]: Wanted formats, in order of preference
+        :return: A list of Pillow format names
+        """
+        from PIL import Image
+
+        Image.init()
+        supported = [fmt.upper() for fmt in formats if fmt.upper() in Image.SAVE]
+        if not supported:
+            raise ValueError(f'None of the avatar formats {formats} is supported by Pillow')
+        return supported
+
+    async def store(self, path: str, route: str) -> str:
+        """
+        The store function renders the avatar in the process pool and returns the url of its main file.
+
+        :param self: Represent the instance of the class
+        :param path: str: The uploaded image on the local disk
+        :param route: str: The name returned by get_name, not needed for content-addressed files
+        :return: The url of the avatar
+        """
+        if self.executor is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        name = await loop.run_in_executor(self.executor, render_avatar, path, self.directory, self.sizes,
+                                          self.formats)
+        return self.base_url + name
+
+    async def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    Serves the rendered avatars. Their names change whenever the content does, so they can be cached forever.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+
+def get_storage() -> AvatarStorage:
+    """
+    The get_storage function builds the avatar storage selected by settings.avatar_storage.
+
+    :return: An AvatarStorage
+    """
+    if settings.avatar_storage == 'local':
+        return LocalImageStorage(settings.avatar_local_path, settings.avatar_base_url, settings.avatar_sizes,
+                                 settings.avatar_formats, workers=settings.avatar_workers)
+    return CloudImage()
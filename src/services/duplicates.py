@@ -0,0 +1,127 @@
+"""
+Blocking keys and scoring for duplicate contacts.
+
+Every contact gets three normalized keys when it is written: its email, its phone number in E.164
+and its sorted name tokens. Contacts that share a key are candidates, found with a GROUP BY over
+an index on (user_id, key) instead of comparing every pair of contacts. Only the members of a candidate
+group, which is small, are compared with each other to score it.
+"""
+import re
+import unicodedata
+from itertools import combinations
+from typing import Dict, List, Optional
+
+from src.services.phone import to_e164
+
+KEYS = ('email_key', 'phone_e164', 'name_key')
+KEY_WEIGHTS = {'email_key': 0.5, 'phone_e164': 0.35, 'name_key': 0.15}
+GMAIL_DOMAINS = ('gmail.com', 'googlemail.com')
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """
+    The normalize_email function lowercases an email and drops the ``+tag`` of its local part.
+    Gmail addresses also lose their dots, which gmail ignores.
+
+    :param email: str: The email as it was entered
+    :return: The key, or None if the value is not an email
+    """
+    if not email or '@' not in email:
+        return None
+    local, _, domain = email.strip().lower().rpartition('@')
+    local = local.split('+', 1)[0]
+    if domain in GMAIL_DOMAINS:
+        local, domain = local.replace('.', ''), 'gmail.com'
+    return f'{local}@{domain}' if local else None
+
+
+def name_tokens(value: Optional[str]) -> List[str]:
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return re.findall(r'\w+', value.lower())
+
+
+def normalize_name(first_name: Optional[str], last_name: Optional[str]) -> Optional[str]:
+    """
+    The normalize_name function returns the sorted, lowercased name tokens without accents,
+    so swapped first and last names get the same key.
+
+    :param first_name: str: The first name
+    :param last_name: str: The last name
+    :return: The key, or None if there is no name
+    """
+    tokens = sorted(name_tokens(first_name) + name_tokens(last_name))
+    return ' '.join(tokens)[:100] or None
+
+
+def blocking_keys(first_name: str, last_name: str, email: str, phone_number: str) -> Dict[str, Optional[str]]:
+    """
+    The blocking_keys function computes the keys stored with a contact. The phone key is the number in E.164,
+    which reverse phone lookups use as well.
+
+    :param first_name: str: The first name
+    :param last_name: str: The last name
+    :param email: str: The email
+    :param phone_number: str: The phone number
+    :return: A dict of column name to key
+    """
+    return {
+        'email_key': normalize_email(email),
+        'phone_e164': to_e164(phone_number),
+        'name_key': normalize_name(first_name, last_name),
+    }
+
+
+def pair_score(first, second) -> float:
+    return round(sum(weight for key, weight in KEY_WEIGHTS.items()
+                     if getattr(first, key) is not None and getattr(first, key) == getattr(second, key)), 2)
+
+
+def find_groups(contacts, min_score: float = 0.0) -> List[dict]:
+    """
+    The find_groups function joins the candidates that share any key into groups and scores each group.
+    The score of a group is the best score of a pair in it: 1 when email, phone and name all match.
+
+    :param contacts: The candidate contacts of one user, each sharing at least one key with another
+    :param min_score: float: Groups with a lower score are left out
+    :return: A list of dicts with the score, the matching keys and the contacts, best groups first
+    """
+    parent = {contact.id: contact.id for contact in contacts}
+
+    def find(contact_id):
+        while parent[contact_id] != contact_id:
+            parent[contact_id] = parent[parent[contact_id]]
+            contact_id = parent[contact_id]
+        return contact_id
+
+    for key in KEYS:
+        first_with_key = {}
+        for contact in contacts:
+            value = getattr(contact, key)
+            if value is None:
+                continue
+            if value in first_with_key:
+                parent[find(contact.id)] = find(first_with_key[value])
+            else:
+                first_with_key[value] = contact.id
+
+    members: Dict[int, list] = {}
+    for contact in contacts:
+        members.setdefault(find(contact.id), []).append(contact)
+
+    groups = []
+    for group in members.values():
+        if len(group) < 2:
+            continue
+        group.sort(key=lambda contact: contact.id)
+        score = max(pair_score(first, second) for first, second in combinations(group, 2))
+        if score < min_score:
+            continue
+        keys = []
+        for key in KEYS:
+            values = [getattr(contact, key) for contact in group if getattr(contact, key) is not None]
+            if len(set(values)) < len(values):
+                keys.append(key)
+        groups.append({'score': score, 'keys': keys, 'contacts': group})
+    groups.sort(key=lambda group: (-group['score'], group['contacts'][0].id))
+    return groups
@@ -1,82 +1,298 @@
+import asyncio
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from functools import lru_cache
 from pathlib import Path
+from typing import Dict, Optional
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, Template
 from pydantic import EmailStr
 
-from src.services.auth import AuthToken
+from src.services.auth import authtoken
 from src.conf.config import settings
 
-auth = AuthToken()
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="NoteBook",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
-
-
-async def send_email(email: EmailStr, username: str, host: str):
+# fastapi_mail pulls in httpx and the whole email validation stack on import,
+# so it is imported inside the functions that build or send a message
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+
+
+@lru_cache(maxsize=None)
+def get_mail_config():
+    """
+    The get_mail_config function builds the SMTP configuration from the settings the first time it is needed.
+
+    :return: A fastapi_mail ConnectionConfig
+    """
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username,
+        MAIL_PASSWORD=settings.mail_password,
+        MAIL_FROM=EmailStr(settings.mail_from),
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME="NoteBook",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=TEMPLATE_FOLDER,
+    )
+
+# errors after which the SMTP session is dropped and the message is sent again over a new one
+RECONNECT_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, aiosmtplib.SMTPTimeoutError,
+                    ConnectionError)
+
+
+class Mailer:
     """
-    The send_email function sends an email to the user with a link to confirm their email address.
-    The function takes in three arguments:
-    -email: The user's email address, which is used as the recipient of the message.
-    -username: The username of the user, which is used in constructing a personalized greeting for them.
-    -host: The hostname that will be included in the confirmation link sent to them.
+    Long-lived mail sender. Templates are compiled once and SMTP sessions are kept
+    in a small pool and reused across messages instead of a new SSL session per email.
+    Without an explicit config the one from the settings is built on first use.
+    """
+
+    def __init__(self, config=None, pool_size: int = 1, template_folder: Path = TEMPLATE_FOLDER):
+        self._config = config
+        self.env = Environment(loader=FileSystemLoader(config.TEMPLATE_FOLDER if config else template_folder),
+                               auto_reload=False)
+        self.templates: Dict[str, Template] = {}
+        self.pool_size = pool_size
+        self.pool: Optional[asyncio.LifoQueue] = None
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = get_mail_config()
+        return self._config
+
+    def get_template(self, template_name: str) -> Template:
+        """
+        The get_template function returns a compiled template, loading it from disk only the first time.
+
+        :param self: Represent the instance of the class
+        :param template_name: str: The file name of the template in the templates folder
+        :return: A compiled jinja template
+        """
+        template = self.templates.get(template_name)
+        if template is None:
+            template = self.templates[template_name] = self.env.get_template(template_name)
+        return template
+
+    async def build_message(self, message, template_name: str = None) -> MIMEMultipart:
+        """
+        The build_message function renders the template into the message body and builds the MIME message
+        with the standard library, the same way fastapi_mail lays it out. Attachments are not supported.
+
+        :param self: Represent the instance of the class
+        :param message: MessageSchema: The message to send
+        :param template_name: str: The template used to render template_body
+        :return: A MIME message ready to be sent
+        """
+        if message.attachments:
+            raise ValueError('attachments are not supported')
+        if template_name and message.template_body is not None:
+            message.template_body = self.get_template(template_name).render(**message.template_body)
+        sender = f'{self.config.MAIL_FROM_NAME} <{self.config.MAIL_FROM}>' if self.config.MAIL_FROM_NAME \
+            else self.config.MAIL_FROM
+
+        msg = MIMEMultipart(message.multipart_subtype.value)
+        msg.set_charset(message.charset)
+        msg['Date'] = formatdate(localtime=True)
+        msg['Message-ID'] = make_msgid()
+        msg['To'] = ', '.join(message.recipients)
+        msg['From'] = sender
+        if message.subject:
+            msg['Subject'] = message.subject
+        for header, addresses in (('Cc', message.cc), ('Bcc', message.bcc), ('Reply-To', message.reply_to)):
+            if addresses:
+                msg[header] = ', '.join(addresses)
+        body = message.template_body or message.body
+        if body:
+            msg.attach(MIMEText(body, _subtype=message.subtype.value, _charset=message.charset))
+        for header, value in (message.headers or {}).items():
+            msg.add_header(header, value)
+        return msg
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        """
+        The connect function opens and authenticates a new SMTP session.
+
+        :param self: Represent the instance of the class
+        :return: A connected SMTP client
+        """
+        from fastapi_mail.errors import ConnectionErrors
+
+        smtp = aiosmtplib.SMTP(
+            hostname=self.config.MAIL_SERVER,
+            port=self.config.MAIL_PORT,
+            timeout=self.config.TIMEOUT,
+            use_tls=self.config.MAIL_SSL_TLS,
+            start_tls=self.config.MAIL_STARTTLS,
+            validate_certs=self.config.VALIDATE_CERTS,
+        )
+        try:
+            await smtp.connect()
+            if self.config.USE_CREDENTIALS:
+                await smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD)
+        except Exception as err:
+            smtp.close()
+            raise ConnectionErrors(f'Exception raised {err}, check your credentials or email service configuration')
+        return smtp
+
+    async def acquire(self) -> aiosmtplib.SMTP:
+        """
+        The acquire function takes a session from the pool, connecting a new one if the slot is empty
+        or the server has closed the kept session.
+
+        :param self: Represent the instance of the class
+        :return: A connected SMTP client
+        """
+        if self.pool is None:
+            self.pool = asyncio.LifoQueue(self.pool_size)
+            for _ in range(self.pool_size):
+                self.pool.put_nowait(None)
+        smtp = await self.pool.get()
+        if smtp is not None and smtp.is_connected:
+            return smtp
+        try:
+            return await self.connect()
+        except Exception:
+            self.pool.put_nowait(None)
+            raise
+
+    def release(self, smtp: Optional[aiosmtplib.SMTP]):
+        self.pool.put_nowait(smtp)
 
-    :param email: EmailStr: Specify the type of email address that is expected
+    async def send(self, msg: MIMEMultipart):
+        """
+        The send function sends a built message over a pooled session.
+        If the session turns out to be dead, it is replaced and the message is sent once more.
+
+        :param self: Represent the instance of the class
+        :param msg: MIMEMultipart: The message to send
+        :return: None
+        """
+        from fastapi_mail.errors import ConnectionErrors
+
+        for attempt in range(2):
+            smtp = await self.acquire()
+            try:
+                await smtp.send_message(msg)
+            except RECONNECT_ERRORS as err:
+                smtp.close()
+                self.release(None)
+                if attempt:
+                    raise ConnectionErrors(f'Exception raised {err}, check your email service configuration')
+            except Exception:
+                self.release(smtp)
+                raise
+            else:
+                self.release(smtp)
+                return
+
+    async def send_message(self, message, template_name: str = None):
+        """
+        The send_message function renders and sends one message.
+
+        :param self: Represent the instance of the class
+        :param message: MessageSchema: The message to send
+        :param template_name: str: The template used to render template_body
+        :return: None
+        """
+        msg = await self.build_message(message, template_name)
+        if not self.config.SUPPRESS_SEND:
+            await self.send(msg)
+
+    async def close(self):
+        """
+        The close function politely quits every pooled SMTP session.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self.pool is None:
+            return
+        while not self.pool.empty():
+            smtp = self.pool.get_nowait()
+            if smtp is not None and smtp.is_connected:
+                try:
+                    await smtp.quit()
+                except aiosmtplib.SMTPException:
+                    smtp.close()
+        self.pool = None
+
+
+async def confirm_email_message(email: EmailStr, username: str, host: str, payload: dict = None):
+    """
+    The confirm_email_message function builds the message with a link to confirm the user's email address.
+
+    :param email: EmailStr: The recipient's email address
     :param username: str: Display the username in the email
     :param host: str: Pass the hostname of the server to be used in the email
-    :return: A coroutine
-    :doc-author: Trelent
+    :param payload: dict: Not used by this email
+    :return: The message and the name of its template
     """
-    try:
-        token_verification = await auth.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
+    from fastapi_mail import MessageSchema, MessageType
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_verification = await authtoken.create_email_token({"sub": email})
+    message = MessageSchema(
+        subject="Confirm your email",
+        recipients=[email],
+        template_body={"host": host, "username": username, "token": token_verification},
+        subtype=MessageType.html
+    )
+    return message, "email_template.html"
 
 
-async def pass_reset_email(email: EmailStr, username: str, host: str):
+async def reset_password_message(email: EmailStr, username: str, host: str, payload: dict = None):
     """
-    The pass_reset_email function sends an email to the user with a link to reset their password.
-    The function takes in three arguments:
-    - email: the user's email address, which is used as a unique identifier for that user.
-    - username: the username of the account associated with this email address. This is used in
-    conjunction with host (see below) to create a URL that will be sent via an HTML template
-    (reset_password_template.html). This URL will direct users back to our website where they can reset their password.
-
-    :param email: EmailStr: Specify the email address of the user
+    The reset_password_message function builds the message with a link to reset the user's password.
+
+    :param email: EmailStr: The recipient's email address
     :param username: str: Personalize the email
     :param host: str: Pass the host of the website
-    :return: A value of type nonetype
-    :doc-author: Trelent
+    :param payload: dict: Not used by this email
+    :return: The message and the name of its template
     """
-    try:
-        token_verification = await auth.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Reset password",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
+    from fastapi_mail import MessageSchema, MessageType
+
+    token_verification = await authtoken.create_email_token({"sub": email})
+    message = MessageSchema(
+        subject="Reset password",
+        recipients=[email],
+        template_body={"host": host, "username": username, "token": token_verification},
+        subtype=MessageType.html
+    )
+    return message, "reset_password_template.html"
+
+
+async def birthday_digest_message(email: EmailStr, username: str, host: str, payload: dict = None):
+    """
+    The birthday_digest_message function builds the digest of the user's contacts who have a birthday soon.
+    The contacts are computed by the nightly job and stored with the outbox entry.
+
+    :param email: EmailStr: The recipient's email address
+    :param username: str: Personalize the email
+    :param host: str: Pass the host of the website
+    :param payload: dict: The contacts, each with first_name, last_name and birthday
+    :return: The message and the name of its template
+    """
+    from fastapi_mail import MessageSchema, MessageType
+
+    contacts = (payload or {}).get('contacts', [])
+    message = MessageSchema(
+        subject=f"Upcoming birthdays: {len(contacts)}",
+        recipients=[email],
+        template_body={"host": host, "username": username, "contacts": contacts},
+        subtype=MessageType.html
+    )
+    return message, "birthday_digest_template.html"
+
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="reset_password_template.html")
-    except ConnectionErrors as err:
-        print(err)
+EMAIL_KINDS = {
+    'confirm_email': confirm_email_message,
+    'reset_password': reset_password_message,
+    'birthday_digest': birthday_digest_message,
+}
@@ -0,0 +1,16 @@
+import hashlib
+from functools import lru_cache
+
+GRAVATAR_URL = 'https://www.gravatar.com/avatar/{}'
+
+
+@lru_cache(maxsize=4096)
+def gravatar_url(email: str) -> str:
+    """
+    The gravatar_url function builds the default avatar url of an email address.
+    It is only an md5 of the normalized address formatted into the gravatar url, so nothing goes over the network.
+
+    :param email: str: The user's email address
+    :return: The gravatar url
+    """
+    return GRAVATAR_URL.format(hashlib.md5(email.strip().lower().encode()).hexdigest())
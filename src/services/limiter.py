@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Optional
+
+from fastapi import Depends, HTTPException, Response, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.auth import authtoken
+from src.services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Token bucket kept in a redis hash {tokens, ts}. Refill, take and expire happen in one atomic call,
+# so a request costs exactly one round trip. Time comes from the redis server to keep workers in sync.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry = math.ceil((cost - tokens) / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate))
+return {allowed, math.floor(tokens), math.ceil((capacity - tokens) / rate), retry}
+"""
+
+# Batched reconciliation for the hybrid mode: every key gets its locally consumed tokens subtracted
+# (the bucket may go into debt of up to one capacity) and the authoritative token count is returned.
+SYNC_BUCKETS_LUA = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local result = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    tokens = math.max(-capacity, tokens - cost)
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(2 * capacity / rate))
+    result[i] = tostring(tokens)
+end
+return result
+"""
+
+
+class LocalBucket:
+    __slots__ = ('capacity', 'rate', 'tokens', 'ts', 'pending')
+
+    def __init__(self, capacity: int, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.ts = now
+        self.pending = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+
+class LocalBuckets:
+    """
+    Worker-local approximation of the redis buckets used by the hybrid mode.
+    Requests are admitted from memory and the consumed tokens are pushed to redis in one batched
+    call every ``interval`` seconds, which also pulls back what the other workers have consumed.
+    A worker may over-admit by ``error * capacity`` plus whatever the other workers took since the last sync.
+    """
+    batch_size = 500
+
+    def __init__(self, interval: float, error: float):
+        self.interval = interval
+        self.error = error
+        self.buckets: Dict[str, LocalBucket] = {}
+        self.script = None
+        self.task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def now():
+        return time.monotonic() * 1000
+
+    def take(self, key: str, capacity: int, rate: float, cost: int = 1):
+        """
+        The take function tries to take tokens from the local bucket without any network call.
+        It returns the same (allowed, remaining, reset_ms, retry_ms) tuple as the redis script.
+
+        :param self: Represent the instance of the class
+        :param key: str: The redis key of the bucket
+        :param capacity: int: The size of the bucket
+        :param rate: float: Tokens refilled per millisecond
+        :param cost: int: Tokens needed by the request
+        :return: A tuple of four integers
+        """
+        now = self.now()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = LocalBucket(capacity, rate, now)
+        else:
+            bucket.refill(now)
+
+        allowed, retry = 0, 0
+        # the bucket may go below zero by the allowed error, so a request waits only for what is missing above it
+        threshold = cost - capacity * self.error
+        if bucket.tokens >= threshold:
+            bucket.tokens -= cost
+            bucket.pending += cost
+            allowed = 1
+        else:
+            retry = math.ceil((threshold - bucket.tokens) / rate)
+        tokens = max(bucket.tokens, 0)
+        return allowed, math.floor(tokens), math.ceil((capacity - tokens) / rate), retry
+
+    async def sync(self):
+        """
+        The sync function pushes the pending consumption of every known bucket to redis and replaces
+        the local token counts with the authoritative ones. Buckets that were idle long enough to be
+        full again are forgotten to keep memory bounded.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        now = self.now()
+        for key in [key for key, bucket in self.buckets.items()
+                    if not bucket.pending and now - bucket.ts > bucket.capacity / bucket.rate]:
+            del self.buckets[key]
+
+        items = list(self.buckets.items())
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            args = []
+            for key, bucket in batch:
+                args.extend((bucket.capacity, bucket.rate, bucket.pending))
+            sent = [bucket.pending for _, bucket in batch]
+            for _, bucket in batch:
+                bucket.pending = 0
+            try:
+                tokens = await self.script(keys=[key for key, _ in batch], args=args)
+            except BaseException as err:
+                # also when the sync is cancelled mid-call, so the final flush on stop still sends these
+                for (_, bucket), pending in zip(batch, sent):
+                    bucket.pending += pending
+                if isinstance(err, RedisError):
+                    logger.warning('rate limit sync failed: %s', err)
+                    return
+                raise
+            now = self.now()
+            for (_, bucket), value in zip(batch, tokens):
+                # requests admitted while the call was in flight are still pending locally
+                bucket.tokens = float(value) - bucket.pending
+                bucket.ts = now
+
+    async def run(self):
+        """
+        The run function is the background loop of the hybrid mode, syncing buckets every interval.
+        An unexpected error is logged and the loop goes on, so the buckets keep being reconciled.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception('rate limit sync failed')
+
+    def start(self, r: Redis):
+        self.script = r.register_script(SYNC_BUCKETS_LUA)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        The stop function cancels the sync loop, waits until it has finished and flushes the pending consumption.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.sync()
+
+
+class RateLimiter:
+    """
+    Per-user token bucket limiter. The bucket holds ``times`` tokens and refills
+    at ``times / seconds`` tokens per second, so short bursts are allowed while the
+    long-run rate stays the same as a fixed ``times`` per ``seconds`` window.
+    With ``rate_limit_mode = 'hybrid'`` buckets are checked in memory and reconciled with redis in batches,
+    and ``rate_limit_mode = 'off'`` lets every request through, e.g. for load tests.
+    """
+    enabled = True
+    redis: Optional[Redis] = None
+    script = None
+    buckets: Optional[LocalBuckets] = None
+    prefix = 'ratelimit'
+
+    def __init__(self, times: int, seconds: int, group: str):
+        self.times = times
+        self.seconds = seconds
+        self.group = group
+        self.rate = times / (seconds * 1000)
+
+    @classmethod
+    async def init(cls, r: Redis, mode: str = settings.rate_limit_mode):
+        """
+        The init function stores the redis connection and registers the token bucket script on it.
+        The script is sent by its sha1 and reloaded by redis-py only when the server does not know it.
+        In the hybrid mode it also starts the background sync of the local buckets.
+
+        :param r: Redis: The asyncio redis connection used for all limiters
+        :param mode: str: 'redis' to check every request in redis, 'hybrid' to check locally, 'off' to disable
+        :return: None
+        """
+        cls.enabled = mode != 'off'
+        if not cls.enabled:
+            return
+        cls.redis = r
+        cls.script = r.register_script(TOKEN_BUCKET_LUA)
+        if mode == 'hybrid':
+            cls.buckets = LocalBuckets(settings.rate_limit_sync_interval, settings.rate_limit_local_error)
+            cls.buckets.start(r)
+
+    @classmethod
+    async def close(cls):
+        """
+        The close function stops the hybrid sync loop, flushing what was consumed since the last sync.
+
+        :return: None
+        """
+        if cls.buckets is not None:
+            await cls.buckets.stop()
+            cls.buckets = None
+
+    def get_key(self, user: int):
+        """
+        The get_key function builds the redis key of a user's bucket for this route group.
+
+        :param self: Represent the instance of the class
+        :param user: int: The id of the authenticated user
+        :return: The redis key of the bucket
+        """
+        return f'{self.prefix}:{self.group}:{user}'
+
+    def get_headers(self, remaining: int, reset_ms: int):
+        """
+        The get_headers function builds the RateLimit-* headers for the current state of a bucket.
+
+        :param self: Represent the instance of the class
+        :param remaining: int: Whole tokens left in the bucket
+        :param reset_ms: int: Milliseconds until the bucket is full again
+        :return: A dictionary of headers
+        """
+        return {
+            'RateLimit-Limit': str(self.times),
+            'RateLimit-Remaining': str(remaining),
+            'RateLimit-Reset': str(math.ceil(reset_ms / 1000)),
+        }
+
+    async def __call__(self, response: Response, user: int = Depends(authtoken.get_current_user)):
+        """
+        The __call__ function takes one token from the user's bucket or rejects the request with 429.
+
+        :param self: Represent the instance of the class
+        :param response: Response: Used to attach the RateLimit-* headers
+        :param user: int: The id of the authenticated user
+        :return: None
+        """
+        if not self.enabled:
+            return
+        key = self.get_key(user)
+        with tracer.span('limiter', group=self.group):
+            if self.buckets is not None:
+                allowed, remaining, reset_ms, retry_ms = self.buckets.take(key, self.times, self.rate)
+            else:
+                allowed, remaining, reset_ms, retry_ms = await self.script(keys=[key],
+                                                                           args=[self.times, self.rate, 1])
+        headers = self.get_headers(remaining, reset_ms)
+        if not allowed:
+            headers['Retry-After'] = str(math.ceil(retry_ms / 1000))
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail='Too Many Requests',
+                                headers=headers)
+        response.headers.update(headers)
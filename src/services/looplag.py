@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from src.conf.config import settings
+from src.services.metrics import LOOP_BLOCKED, LOOP_LAG
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task that sleeps for ``interval`` seconds.
+    Any lag is time the loop spent in a callback that did not yield, e.g. a sync query, a sync
+    redis call or bcrypt inside an ``async def`` handler.
+
+    In debug mode a watchdog thread also notices while the loop is still blocked and logs the stack
+    of the loop thread at that moment, which points at the blocking call itself.
+    """
+
+    def __init__(self, interval: float = settings.loop_lag_interval, threshold: float = settings.loop_lag_threshold,
+                 debug: bool = settings.loop_lag_debug):
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def record(self, lag: float):
+        """
+        The record function reports one lag sample to the metrics and logs it if it is over the threshold.
+
+        :param self: Represent the instance of the class
+        :param lag: float: How late the sampler woke up, in seconds
+        :return: None
+        """
+        LOOP_LAG.observe(lag)
+        if lag > self.threshold:
+            logger.warning('event loop was blocked for %.0fms', lag * 1000)
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            self.heartbeat = started
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, time.monotonic() - started - self.interval))
+
+    def watch(self):
+        """
+        The watch function runs in the watchdog thread. When the sampler is overdue by more than the threshold,
+        it captures the stack of the loop thread once per stall.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        reported = None
+        while not self.stopped.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            if heartbeat == reported or time.monotonic() - heartbeat < self.interval + self.threshold:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            LOOP_BLOCKED.inc()
+            logger.warning('event loop blocked for more than %.0fms, loop thread stack:\n%s',
+                           self.threshold * 1000, ''.join(traceback.format_stack(frame)))
+
+    def start(self):
+        """
+        The start function starts the sampler on the running loop, and the watchdog thread in debug mode.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.task = asyncio.create_task(self.run())
+        if self.debug:
+            self.stopped.clear()
+            self.watchdog = threading.Thread(target=self.watch, name='loop-lag-watchdog', daemon=True)
+            self.watchdog.start()
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.watchdog is not None:
+            self.stopped.set()
+            self.watchdog.join()
+            self.watchdog = None
+
+
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,179 @@
+"""
+Prometheus metrics of the web workers and the outbox worker.
+
+Label values are bound once and the children are kept, so recording a sample on the request path
+is an attribute lookup and an add, without building a label dict. The database pool is read only
+when /metrics is scraped. Without prometheus_client installed every metric is a no-op, and a warning
+is logged when the app or the outbox worker starts.
+"""
+import logging
+import time
+from typing import Dict, Tuple
+
+from src.services.resources import resources
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:  # metrics are optional
+    REGISTRY = None
+
+logger = logging.getLogger(__name__)
+
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class NullMetric:
+    """
+    Stands in for every metric when prometheus_client is not installed.
+    """
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def dec(self, amount: float = 1):
+        pass
+
+    def observe(self, amount: float):
+        pass
+
+
+if REGISTRY is not None:
+    REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Latency of HTTP requests by route template',
+                                ['method', 'route', 'status'])
+    REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being processed')
+    USER_CACHE = Counter('auth_user_cache_total', 'Lookups of the get_current_user cache in redis', ['result'])
+    BCRYPT_QUEUE = Histogram('bcrypt_queue_seconds', 'Time a bcrypt call waited for a worker thread',
+                             buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+    BCRYPT_DURATION = Histogram('bcrypt_duration_seconds', 'Time spent hashing or verifying a password',
+                                buckets=(.05, .1, .2, .3, .5, .75, 1, 2.5))
+    EMAILS = Counter('email_send_total', 'Outcomes of outbox email deliveries', ['result'])
+    LOOP_LAG = Histogram('event_loop_lag_seconds', 'How late the event loop woke up the lag sampler',
+                         buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+    LOOP_BLOCKED = Counter('event_loop_blocked_total', 'Stalls of the event loop caught by the watchdog')
+else:
+    REQUEST_LATENCY = REQUESTS_IN_FLIGHT = USER_CACHE = BCRYPT_QUEUE = BCRYPT_DURATION = EMAILS = NullMetric()
+    LOOP_LAG = LOOP_BLOCKED = NullMetric()
+
+USER_CACHE_HIT = USER_CACHE.labels('hit')
+USER_CACHE_MISS = USER_CACHE.labels('miss')
+EMAIL_SENT = EMAILS.labels('sent')
+EMAIL_RETRIED = EMAILS.labels('retried')
+EMAIL_FAILED = EMAILS.labels('failed')
+
+
+class DatabasePoolCollector:
+    """
+    Reports the state of the database pool at scrape time. Nothing is recorded per request.
+    """
+
+    def collect(self):
+        engine = resources._engine
+        pool = getattr(engine, 'pool', None)
+        if pool is None or not callable(getattr(pool, 'checkedout', None)):
+            return
+        stats = (
+            ('db_pool_size', 'Connections the pool keeps open', pool.size()),
+            ('db_pool_checked_in', 'Idle connections in the pool', pool.checkedin()),
+            ('db_pool_checked_out', 'Connections in use', pool.checkedout()),
+            ('db_pool_overflow', 'Connections opened above the pool size', pool.overflow()),
+        )
+        for name, documentation, value in stats:
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+
+if REGISTRY is not None:
+    REGISTRY.register(DatabasePoolCollector())
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every request under the path template of the route that handled it,
+    e.g. ``/api/contacts/{contact_id}``, and counts the requests in flight.
+    Histogram children are bound the first time a route, method and status class is seen.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.children: Dict[Tuple[str, str], tuple] = {}
+
+    def get_children(self, method: str, route: str):
+        """
+        The get_children function returns the histogram children of a route and method, one per status class.
+
+        :param self: Represent the instance of the class
+        :param method: str: The HTTP method
+        :param route: str: The path template of the route
+        :return: A tuple indexed by status // 100 - 1
+        """
+        key = (method, route)
+        children = self.children.get(key)
+        if children is None:
+            children = self.children[key] = tuple(REQUEST_LATENCY.labels(method, route, status_class)
+                                                  for status_class in STATUS_CLASSES)
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            route = scope.get('route')
+            children = self.get_children(scope['method'], route.path if route is not None else UNMATCHED_ROUTE)
+            children[min(max(status_code // 100, 1), 5) - 1].observe(elapsed)
+
+
+def check_metrics() -> bool:
+    """
+    The check_metrics function warns at startup that metrics are enabled but cannot be collected.
+
+    :return: True if prometheus_client is installed
+    """
+    if REGISTRY is None:
+        logger.warning('prometheus_client is not installed: metrics are not collected and /metrics answers 404')
+        return False
+    return True
+
+
+def render_metrics():
+    """
+    The render_metrics function serializes every registered metric in the Prometheus text format.
+
+    :return: The body and its content type, or None if prometheus_client is not installed
+    """
+    if REGISTRY is None:
+        return None
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int):
+    """
+    The start_metrics_server function serves /metrics on its own port, for processes without a web app
+    such as the outbox worker.
+
+    :param port: int: The port to listen on
+    :return: None
+    """
+    if check_metrics():
+        from prometheus_client import start_http_server
+
+        start_http_server(port)
@@ -0,0 +1,128 @@
+"""
+Outbox worker. Run it as a separate process next to the web workers::
+
+    python -m src.services.outbox
+"""
+import asyncio
+import logging
+import time
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.repository import outbox as repository_outbox
+from src.services.email import EMAIL_KINDS, Mailer
+from src.services.metrics import EMAIL_FAILED, EMAIL_RETRIED, EMAIL_SENT, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """
+    Drains the email outbox in batches. A batch is claimed in a short transaction, its messages go over
+    the mailer's single kept-alive SMTP session, and the outcome of each message is committed as soon as
+    it is known. No rows stay locked during the sends, and a crash loses at most the claim of the messages
+    not yet sent, which are retried once the claim expires.
+    """
+
+    def __init__(self, mailer: Mailer, session_factory=SessionLocal, batch_size: int = settings.mail_batch_size,
+                 max_attempts: int = settings.mail_max_attempts, backoff: float = settings.mail_retry_backoff,
+                 poll_interval: float = settings.mail_poll_interval,
+                 claim_timeout: float = settings.mail_claim_timeout):
+        self.mailer = mailer
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def send(self, message):
+        """
+        The send function renders and sends one outbox entry.
+
+        :param self: Represent the instance of the class
+        :param message: EmailOutbox: The entry to send
+        :return: None
+        """
+        build_message = EMAIL_KINDS[message.kind]
+        schema, template_name = await build_message(message.email, message.username, message.host, message.payload)
+        await self.mailer.send_message(schema, template_name=template_name)
+
+    async def drain_once(self):
+        """
+        The drain_once function sends one batch of due emails and records the outcome of each.
+
+        :param self: Represent the instance of the class
+        :return: The number of processed entries
+        """
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            messages = await repository_outbox.claim_emails(self.batch_size, self.claim_timeout, db)
+            db.commit()
+            started = time.perf_counter()
+            for message in messages:
+                try:
+                    await self.send(message)
+                except Exception as err:
+                    await repository_outbox.mark_failed(message, str(err), self.max_attempts, self.backoff, db)
+                    db.commit()
+                    if message.status == 'failed':
+                        self.failed += 1
+                        EMAIL_FAILED.inc()
+                        logger.error('giving up on %s email to %s: %s', message.kind, message.email, err)
+                    else:
+                        self.retried += 1
+                        EMAIL_RETRIED.inc()
+                else:
+                    await repository_outbox.mark_sent(message, db)
+                    db.commit()
+                    self.sent += 1
+                    EMAIL_SENT.inc()
+        finally:
+            db.close()
+
+        if messages:
+            elapsed = time.perf_counter() - started
+            logger.info('outbox batch: %d emails in %.3fs (%.1f/s), total sent=%d retried=%d failed=%d',
+                        len(messages), elapsed, len(messages) / elapsed if elapsed else 0.0,
+                        self.sent, self.retried, self.failed)
+        return len(messages)
+
+    async def run(self):
+        """
+        The run function drains the outbox forever, sleeping only when there is nothing due.
+        An error outside the sending of one message, e.g. the database being down, is logged and the loop
+        goes on after poll_interval, so the worker keeps draining once the cause is gone.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        try:
+            while True:
+                try:
+                    drained = await self.drain_once()
+                except Exception:
+                    logger.exception('outbox batch failed')
+                    drained = 0
+                if drained < self.batch_size:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            await self.mailer.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    if settings.outbox_metrics_port:
+        start_metrics_server(settings.outbox_metrics_port)
+    worker = OutboxWorker(Mailer(pool_size=1))
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
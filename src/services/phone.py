@@ -0,0 +1,36 @@
+import re
+from typing import Optional
+
+from src.conf.config import settings
+
+E164_MIN_DIGITS = 8
+E164_MAX_DIGITS = 15
+
+
+def to_e164(number: Optional[str], country_code: Optional[str] = None) -> Optional[str]:
+    """
+    The to_e164 function brings a phone number as it was typed into the canonical E.164 form, ``+380671234567``.
+    Numbers with a ``+`` or ``00`` prefix are international; a single leading ``0`` is the trunk prefix of
+    a national number and is replaced by the default country code, as is the missing code of a bare
+    subscriber number.
+
+    :param number: str: The phone number in any format, e.g. ``(067) 123-45-67``
+    :param country_code: str: The calling code of numbers written without one, the configured one by default
+    :return: The number in E.164, or None if it cannot be a phone number
+    """
+    if not number:
+        return None
+    country_code = country_code or settings.phone_default_country_code
+    number = number.strip()
+    digits = re.sub(r'\D', '', number)
+    if number.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith('0'):
+        digits = country_code + digits[1:]
+    elif not digits.startswith(country_code):
+        digits = country_code + digits
+    if not E164_MIN_DIGITS <= len(digits) <= E164_MAX_DIGITS or digits.startswith('0'):
+        return None
+    return f'+{digits}'
@@ -0,0 +1,177 @@
+"""
+On-demand profiling of a single request.
+
+A request sent with the ``X-Profile`` header set to ``settings.profiling_secret`` is run under a
+sampling profiler: a thread reads the stack of the event loop thread every ``profiling_interval``
+seconds and keeps the samples taken while the request's own task was running. The profile is
+written in the speedscope format (https://www.speedscope.app) to ``profiling_path``, and its file
+name is returned in the ``X-Profile`` response header.
+
+Without a secret configured the middleware is not installed. With one, a request without the
+header costs a scan of its headers and nothing more.
+"""
+import asyncio
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from src.conf.config import settings
+
+HEADER = b'x-profile'
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+
+class RequestProfiler:
+    """
+    Samples the stack of one asyncio task from a background thread.
+    Time the task spends awaiting, e.g. a query run in the threadpool, is not sampled.
+    """
+
+    def __init__(self, interval: float = settings.profiling_interval, root=None):
+        self.interval = interval
+        self.root = root
+        self.frames: List[dict] = []
+        self.frame_ids: Dict[Tuple[str, str, int], int] = {}
+        self.samples: List[List[int]] = []
+        self.weights: List[float] = []
+        self.started = self.finished = 0.0
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.loop = None
+        self.task = None
+        self.thread_id = None
+
+    def frame_id(self, frame) -> int:
+        code = frame.f_code
+        key = (getattr(code, 'co_qualname', code.co_name), code.co_filename, code.co_firstlineno)
+        frame_id = self.frame_ids.get(key)
+        if frame_id is None:
+            frame_id = self.frame_ids[key] = len(self.frames)
+            self.frames.append({'name': key[0], 'file': key[1], 'line': key[2]})
+        return frame_id
+
+    def stack(self, frame) -> List[int]:
+        """
+        The stack function turns a frame into a list of frame ids from the outermost call to the frame.
+        Frames above the ``root`` code object, the event loop and the server, are dropped.
+
+        :param self: Represent the instance of the class
+        :param frame: The innermost frame
+        :return: A list of frame ids
+        """
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            if frame.f_code is self.root:
+                break
+            frame = frame.f_back
+        return [self.frame_id(frame) for frame in reversed(frames)]
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None and asyncio.current_task(self.loop) is self.task:
+                self.samples.append(self.stack(frame))
+                self.weights.append(now - last)
+            last = now
+
+    def start(self):
+        """
+        The start function starts sampling the task that calls it.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.finished = time.perf_counter()
+
+    def to_speedscope(self, name: str) -> dict:
+        """
+        The to_speedscope function returns the samples as a speedscope file.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of the profile, shown by speedscope
+        :return: The speedscope document
+        """
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': name,
+            'exporter': 'contacts-api',
+            'activeProfileIndex': 0,
+            'shared': {'frames': self.frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': self.finished - self.started,
+                'samples': self.samples,
+                'weights': self.weights,
+            }],
+        }
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests that carry the ``X-Profile`` header with the right secret.
+    """
+
+    def __init__(self, app, secret: str = settings.profiling_secret, path: str = settings.profiling_path,
+                 interval: float = settings.profiling_interval):
+        self.app = app
+        self.secret = secret.encode()
+        self.path = path
+        self.interval = interval
+
+    def requested(self, scope) -> bool:
+        for key, value in scope['headers']:
+            if key == HEADER:
+                return hmac.compare_digest(value, self.secret)
+        return False
+
+    def write(self, filename: str, profile: dict):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, filename), 'w', encoding='utf-8') as f:
+            json.dump(profile, f)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.secret or not self.requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{scope['method']} {scope['path']}"
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-')
+        filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}.speedscope.json"
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', ()), (HEADER, filename.encode())]
+            await send(message)
+
+        profiler = RequestProfiler(self.interval, root=ProfilingMiddleware.__call__.__code__)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            route = scope.get('route')
+            if route is not None:
+                name = f"{scope['method']} {route.path}"
+            await asyncio.to_thread(self.write, filename, profiler.to_speedscope(name))
@@ -0,0 +1,110 @@
+import itertools
+import logging
+import time
+from typing import Dict, Optional
+
+import redis
+from fastapi import Depends, HTTPException, status
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.db import get_db, session_factory
+from src.services.auth import authtoken
+from src.services.resources import Resources, get_cache, resources
+
+logger = logging.getLogger(__name__)
+
+
+class ReadRouter:
+    """
+    Sends the sessions of read-only endpoints to the read replicas, in turn.
+
+    A replica that cannot be connected to is skipped for ``retry`` seconds, and reads go to the primary
+    when no replica is configured or none is reachable. A user who has just written is read from
+    the primary for ``window`` seconds, so the replication lag never hides their own changes.
+    The writes are marked in redis, so the window holds across workers.
+    """
+
+    def __init__(self, resources: Resources = resources, window: float = settings.read_your_writes_seconds,
+                 retry: float = settings.replica_retry_seconds):
+        self.resources = resources
+        self.window = window
+        self.retry = retry
+        self.counter = itertools.count()
+        self.down_until: Dict[Engine, float] = {}
+
+    @staticmethod
+    def key(user) -> str:
+        return f'read_your_writes:{user}'
+
+    def record_write(self, user, cache: redis.Redis):
+        """
+        The record_write function sends the reads of the user to the primary for the next ``window`` seconds.
+        It does nothing when there are no replicas.
+
+        :param self: Represent the instance of the class
+        :param user: The id of the user who wrote
+        :param cache: redis.Redis: The redis client
+        :return: None
+        """
+        if self.resources.replicas and self.window > 0:
+            cache.set(self.key(user), 1, px=int(self.window * 1000))
+
+    def wrote_recently(self, user, cache: redis.Redis) -> bool:
+        return self.window > 0 and bool(cache.exists(self.key(user)))
+
+    def connect(self) -> Optional[Connection]:
+        """
+        The connect function checks out a connection from the next replica that is up.
+
+        :param self: Represent the instance of the class
+        :return: A connection, or None if every replica is down
+        """
+        replicas = self.resources.replicas
+        start = next(self.counter)
+        now = time.monotonic()
+        for i in range(len(replicas)):
+            engine = replicas[(start + i) % len(replicas)]
+            if self.down_until.get(engine, 0) > now:
+                continue
+            try:
+                return engine.connect()
+            except OperationalError as err:
+                logger.warning('read replica %s is unreachable, skipping it for %.0fs: %s',
+                               engine.url.render_as_string(hide_password=True), self.retry, err)
+                self.down_until[engine] = now + self.retry
+        return None
+
+
+read_router = ReadRouter()
+
+
+def get_read_db(user: int = Depends(authtoken.get_current_user), db: Session = Depends(get_db),
+                cache: redis.Redis = Depends(get_cache)):
+    """
+    The get_read_db function is the session dependency of read-only endpoints.
+    It yields a session on a read replica, or the primary session of get_db when there are no replicas,
+    none is reachable, or the user wrote within the read-your-writes window.
+
+    :param user: int: The current user
+    :param db: Session: The primary session, used as the fallback
+    :param cache: redis.Redis: The redis client that holds the read-your-writes marks
+    :return: A session for reading
+    """
+    if not read_router.resources.replicas or read_router.wrote_recently(user, cache):
+        yield db
+        return
+    connection = read_router.connect()
+    if connection is None:
+        yield db
+        return
+    session = session_factory(bind=connection)
+    try:
+        yield session
+    except SQLAlchemyError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+    finally:
+        session.close()
+        connection.close()
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Tuple
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy.engine import Engine
+
+from src.conf.config import settings
+from src.database.db import get_engine, get_replica_engines
+
+logger = logging.getLogger(__name__)
+
+
+class Resources:
+    """
+    Owns the connection pools of a worker: the database engine and the engines of its read replicas,
+    the async redis client of the rate limiter, the redis client that caches users and the SMTP sessions
+    of the mailer.
+    Each pool is created on first use, and all of them are drained and closed when the app shuts down.
+    """
+
+    def __init__(self, engine: Optional[Engine] = None, drain_timeout: float = settings.shutdown_drain_timeout):
+        self._engine = engine
+        self._replicas: Optional[Tuple[Engine, ...]] = None
+        self._redis: Optional[AsyncRedis] = None
+        self._cache: Optional[Redis] = None
+        self._mailer = None
+        self.drain_timeout = drain_timeout
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self._engine = get_engine()
+        return self._engine
+
+    @property
+    def replicas(self) -> Tuple[Engine, ...]:
+        if self._replicas is None:
+            self._replicas = get_replica_engines()
+        return self._replicas
+
+    @property
+    def redis(self) -> AsyncRedis:
+        if self._redis is None:
+            self._redis = AsyncRedis(host=settings.redis_host, port=settings.redis_port, db=0)
+        return self._redis
+
+    @property
+    def cache(self) -> Redis:
+        if self._cache is None:
+            self._cache = Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+        return self._cache
+
+    @property
+    def mailer(self):
+        if self._mailer is None:
+            from src.services.email import Mailer
+
+            self._mailer = Mailer(pool_size=settings.mail_pool_size)
+        return self._mailer
+
+    async def drain(self):
+        """
+        The drain function waits until every database connection has been returned to the pool,
+        so requests and background tasks still running at shutdown can finish their transactions.
+        It gives up after drain_timeout seconds.
+
+        :param self: Represent the instance of the class
+        :return: True if the pool was drained in time
+        """
+        if self._engine is None:
+            return True
+        checkedout = getattr(self._engine.pool, 'checkedout', None)
+        if not callable(checkedout):
+            return True
+        deadline = time.monotonic() + self.drain_timeout
+        while checkedout():
+            if time.monotonic() >= deadline:
+                logger.warning('shutting down with %d database connections still in use', checkedout())
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def close(self):
+        """
+        The close function drains the database pool and closes every pool that was opened.
+        The resources can be used again afterwards, e.g. by the next test client.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        await self.drain()
+        if self._mailer is not None:
+            await self._mailer.close()
+        if self._redis is not None:
+            await self._redis.close()
+            await self._redis.connection_pool.disconnect()
+            self._redis = None
+        if self._cache is not None:
+            self._cache.close()
+            self._cache.connection_pool.disconnect()
+            self._cache = None
+        if self._engine is not None:
+            self._engine.dispose()
+        for engine in self._replicas or ():
+            engine.dispose()
+
+
+resources = Resources()
+
+
+def get_cache() -> Redis:
+    return resources.cache
@@ -0,0 +1,305 @@
+"""
+Opt-in request tracing in the shape of OpenTelemetry spans.
+
+A sampled request gets a root span, and every span opened while it runs becomes its child:
+the limiter and auth dependencies, redis calls, repository functions and SQL statements.
+Finished spans are written as JSON lines by a background thread, one object per span with
+OTLP field names, so the file can be replayed into a collector. Outside a sampled request
+``tracer.span`` returns a shared no-op span and costs a single context variable lookup.
+"""
+import functools
+import importlib
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import settings
+
+current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+class NullSpan:
+    """
+    Returned when the current request is not sampled. Every method is a no-op.
+    """
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ('tracer', 'trace_id', 'span_id', 'parent_id', 'name', 'start', 'end', 'attributes', 'error',
+                 'token')
+
+    def __init__(self, tracer: 'Tracer', name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[dict] = None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = self.end = 0
+        self.error = None
+        self.token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start = time.time_ns()
+        self.token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time_ns()
+        if exc is not None:
+            self.error = repr(exc)
+        current_span.reset(self.token)
+        self.tracer.export(self)
+        return False
+
+    def to_dict(self):
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': self.start,
+            'endTimeUnixNano': self.end,
+            'attributes': self.attributes,
+            'status': {'code': 'ERROR', 'message': self.error} if self.error else {'code': 'OK'},
+        }
+
+
+class FileExporter:
+    """
+    Appends finished spans to a JSON lines file from a daemon thread, so the event loop never waits on disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+
+    def export(self, span: dict):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='trace-exporter', daemon=True)
+            self.thread.start()
+        self.queue.put(span)
+
+    def run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                span = self.queue.get()
+                if span is None:
+                    break
+                f.write(json.dumps(span, default=str) + '\n')
+                if self.queue.empty():
+                    f.flush()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+class Tracer:
+    """
+    Starts sampled traces and their child spans and hands finished spans to the exporter.
+    """
+
+    def __init__(self, exporter=None, sample_ratio: float = 1.0):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None):
+        """
+        The start_trace function opens the root span of a request, or returns the no-op span if it is not sampled.
+        A W3C traceparent header continues the caller's trace and follows its sampling decision.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of the root span
+        :param traceparent: str: The traceparent header of the request, if any
+        :return: A span to be used as a context manager
+        """
+        if self.exporter is None:
+            return NULL_SPAN
+        parts = traceparent.split('-') if traceparent else ()
+        if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16 and len(parts[3]) == 2:
+            if parts[3] not in ('01', '03'):
+                return NULL_SPAN
+            return Span(self, name, parts[1], parent_id=parts[2])
+        if random.random() >= self.sample_ratio:
+            return NULL_SPAN
+        return Span(self, name, f'{random.getrandbits(128):032x}')
+
+    def span(self, name: str, **attributes):
+        """
+        The span function opens a child of the current span. Outside a sampled trace it returns the no-op span.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of the span
+        :param attributes: Attributes recorded on the span
+        :return: A span to be used as a context manager
+        """
+        parent = current_span.get()
+        if parent is None:
+            return NULL_SPAN
+        return Span(self, name, parent.trace_id, parent_id=parent.span_id, attributes=attributes)
+
+    def export(self, span: Span):
+        if self.exporter is not None:
+            self.exporter.export(span.to_dict())
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+tracer = Tracer(FileExporter(settings.tracing_export_path) if settings.tracing_enabled else None,
+                sample_ratio=settings.tracing_sample_ratio)
+
+
+def traced(name: str):
+    """
+    The traced function decorates a coroutine function so every call runs in a span of the given name.
+
+    :param name: str: The name of the span
+    :return: The decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_module(module, prefix: str):
+    """
+    The instrument_module function wraps every coroutine function defined in the module in a span.
+    Callers that reach the functions through the module, like the routes do, are traced from then on.
+
+    :param module: The module to instrument, e.g. src.repository.contacts
+    :param prefix: str: Prefix of the span names
+    :return: The names of the wrapped functions
+    """
+    wrapped = []
+    for attr, func in list(vars(module).items()):
+        if inspect.iscoroutinefunction(func) and func.__module__ == module.__name__ \
+                and not hasattr(func, '__wrapped__'):
+            setattr(module, attr, traced(f'{prefix}.{attr}')(func))
+            wrapped.append(attr)
+    return wrapped
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = tracer.span('sql', **{'db.statement': statement})
+    context._trace_span = span.__enter__()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, '_trace_span', None)
+    if span is not None:
+        span.set_attribute('db.rows', cursor.rowcount)
+        context._trace_span = None
+        span.__exit__(None, None, None)
+
+
+def handle_error(exception_context):
+    context = exception_context.execution_context
+    span = getattr(context, '_trace_span', None)
+    if span is not None:
+        context._trace_span = None
+        span.__exit__(type(exception_context.original_exception), exception_context.original_exception, None)
+
+
+def instrument_sql():
+    """
+    The instrument_sql function records a span for every SQL statement run by any engine.
+
+    :return: None
+    """
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+
+
+REPOSITORIES = ('contacts', 'user', 'sessions', 'outbox', 'jobs')
+
+
+def instrument():
+    """
+    The instrument function traces every repository function and every SQL statement.
+    It is called once at startup when tracing is enabled.
+
+    :return: None
+    """
+    instrument_sql()
+    for name in REPOSITORIES:
+        instrument_module(importlib.import_module(f'src.repository.{name}'), f'repository.{name}')
+
+
+class TracingMiddleware:
+    """
+    Opens the root span of every sampled request and names it after the route template once routing is done.
+    """
+
+    def __init__(self, app, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope['headers']:
+            if key == b'traceparent':
+                traceparent = value.decode('latin-1')
+                break
+        span = self.tracer.start_trace(f"{scope['method']} {scope['path']}", traceparent)
+        if span is NULL_SPAN:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                span.set_attribute('http.status_code', message['status'])
+            await send(message)
+
+        with span:
+            span.set_attribute('http.method', scope['method'])
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get('route')
+                if route is not None:
+                    span.name = f"{scope['method']} {route.path}"
+                    span.set_attribute('http.route', route.path)
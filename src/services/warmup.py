@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from src.conf.config import settings
+from src.services.auth import authpassword, authtoken
+from src.services.resources import Resources, resources
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Pays the one-off costs of a fresh worker before it takes traffic: database connections,
+    redis connections, the bcrypt and JWT backends and the email templates.
+    The worker reports ready only after every step has passed. Steps that fail, e.g. because the
+    database or redis is briefly down at boot, are retried in the background with backoff.
+    """
+
+    def __init__(self, resources: Resources, db_connections: int = settings.warmup_db_connections,
+                 retry_backoff: float = settings.warmup_retry_backoff,
+                 retry_max_backoff: float = settings.warmup_retry_max_backoff):
+        self.resources = resources
+        self.db_connections = db_connections
+        self.retry_backoff = retry_backoff
+        self.retry_max_backoff = retry_max_backoff
+        self.ready = False
+        self.checks: Dict[str, str] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def open_connections(self):
+        """
+        The open_connections function checks out several connections at once, so the pool keeps
+        that many open connections afterwards. It never opens more than the pool keeps.
+
+        :param self: Represent the instance of the class
+        :return: The number of opened connections
+        """
+        engine = self.resources.engine
+        size = getattr(engine.pool, 'size', None)
+        count = min(self.db_connections, size()) if callable(size) else self.db_connections
+        connections = []
+        try:
+            for _ in range(count):
+                connection = engine.connect()
+                connections.append(connection)
+                connection.execute(text('SELECT 1'))
+        finally:
+            for connection in connections:
+                connection.close()
+        return count
+
+    async def warm_database(self):
+        await run_in_threadpool(self.open_connections)
+
+    async def warm_redis(self):
+        """
+        The warm_redis function connects the async client used by the rate limiter
+        and the client that caches users in AuthToken.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        await self.resources.redis.ping()
+        await run_in_threadpool(self.resources.cache.ping)
+
+    async def warm_crypto(self):
+        """
+        The warm_crypto function loads the bcrypt backend with one hash and verify,
+        and the jose backend with one token round trip.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        hashed = await authpassword.hash_password('warmup')
+        await authpassword.check_password('warmup', hashed)
+        token = await authtoken.create_access_token(data={'sub': 'warmup'})
+        await authtoken.get_email_from_token(token)
+
+    async def warm_templates(self):
+        mailer = self.resources.mailer
+        for template_name in mailer.env.list_templates():
+            mailer.get_template(template_name)
+
+    async def step(self, name: str, warm):
+        """
+        The step function runs one warm-up step and records how long it took or why it failed.
+
+        :param self: Represent the instance of the class
+        :param name: str: The name of the step in the readiness report
+        :param warm: An awaitable doing the work
+        :return: True if the step passed
+        """
+        started = time.perf_counter()
+        try:
+            await warm
+        except Exception as err:
+            self.checks[name] = f'failed: {err}'
+            logger.error('warm-up step %s failed: %s', name, err)
+            return False
+        self.checks[name] = f'ok in {(time.perf_counter() - started) * 1000:.1f}ms'
+        return True
+
+    async def run_steps(self, names: List[str]) -> List[str]:
+        """
+        The run_steps function runs the named warm-up steps in order.
+
+        :param self: Represent the instance of the class
+        :param names: List[str]: The steps to run
+        :return: The names of the steps that failed
+        """
+        steps = {
+            'database': self.warm_database,
+            'redis': self.warm_redis,
+            'crypto': self.warm_crypto,
+            'templates': self.warm_templates,
+        }
+        return [name for name in names if not await self.step(name, steps[name]())]
+
+    async def run(self):
+        """
+        The run function runs every warm-up step and flips the worker to ready if all of them passed.
+        Otherwise the failed steps are retried in the background and the worker turns ready once they pass.
+
+        :param self: Represent the instance of the class
+        :return: True if the worker is ready
+        """
+        failed = await self.run_steps(['database', 'redis', 'crypto', 'templates'])
+        self.ready = not failed
+        logger.info('warm-up finished, ready=%s %s', self.ready, self.checks)
+        if failed:
+            self.task = asyncio.create_task(self.retry(failed))
+        return self.ready
+
+    async def retry(self, failed: List[str]):
+        """
+        The retry function runs the failed steps again, doubling the delay between attempts up to
+        retry_max_backoff, until all of them pass.
+
+        :param self: Represent the instance of the class
+        :param failed: List[str]: The steps that failed
+        :return: None
+        """
+        delay = self.retry_backoff
+        while failed:
+            await asyncio.sleep(delay)
+            failed = await self.run_steps(failed)
+            delay = min(delay * 2, self.retry_max_backoff)
+        self.ready = True
+        logger.info('warm-up retried, ready=%s %s', self.ready, self.checks)
+
+    async def stop(self):
+        """
+        The stop function reports not ready and cancels the retries that are still running.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.ready = False
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+warmup = Warmup(resources)
@@ -1,5 +1,3 @@
-from unittest.mock import MagicMock
-
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -63,9 +61,7 @@ def contact():
 
 
 @pytest.fixture
-def token(client, user, session, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+def token(client, user, session):
     client.post("/api/auth/signup", json=user)
 
     current_user: User = session.query(User).filter_by(email=user.get('email')).first()
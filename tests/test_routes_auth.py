@@ -1,12 +1,9 @@
-from unittest.mock import MagicMock
-
-from src.database.models import User
+from src.database.models import User, EmailOutbox, UserSession
 from src.schemas import RequestEmail
+from src.services.gravatar import gravatar_url
 
 
-def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+def test_create_user(client, user, session):
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -15,7 +12,11 @@ def test_create_user(client, user, monkeypatch):
     data = response.json()
     assert data["email"] == user.get("email")
     assert data["username"] == user.get("username")
+    assert data["avatar"] == gravatar_url(user.get("email"))
     assert "id" in data
+    message = session.query(EmailOutbox).filter_by(email=user.get("email")).first()
+    assert message.kind == 'confirm_email'
+    assert message.status == 'pending'
 
 
 def test_repeat_create_user(client, user):
@@ -51,6 +52,14 @@ def test_login_user(client, session, user):
     assert data["token_type"] == "bearer"
 
 
+def test_login_email_case(client, user):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email').upper(), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+
+
 def test_login_wrong_password(client, user):
     response = client.post(
         "/api/auth/login",
@@ -76,6 +85,22 @@ def test_refresh_token(client, user, token, session):
     data = response.json()
     assert response.status_code == 200, response.text
     assert data['refresh_token'] is not None
+    assert data['refresh_token'] != token["refresh_token"]
+
+
+def test_refresh_token_reuse(client, user, token, session):
+    response = client.post("api/auth/refresh_token", headers={'Authorization': f'Bearer {token["refresh_token"]}'})
+    assert response.status_code == 200, response.text
+    new_token = response.json()['refresh_token']
+
+    response = client.post("api/auth/refresh_token", headers={'Authorization': f'Bearer {token["refresh_token"]}'})
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid refresh token"
+
+    response = client.post("api/auth/refresh_token", headers={'Authorization': f'Bearer {new_token}'})
+    assert response.status_code == 401, response.text
+    current_user = session.query(User).filter_by(email=user.get('email')).first()
+    assert session.query(UserSession).filter_by(user_id=current_user.id).count() == 0
 
 
 def test_request_not_confirmed_email(client, user):
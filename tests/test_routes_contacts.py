@@ -3,18 +3,13 @@ from unittest.mock import MagicMock, patch, AsyncMock
 import pytest
 
 from src.database.models import User, Contact
-from src.services.auth import AuthToken, AuthPassword
-
-authtoken = AuthToken()
-authpassword = AuthPassword()
+from src.services.resources import resources
 
 
 def test_add_contact(client, session, token, user, contact, monkeypatch):
-    with patch.object(authtoken, 'r') as redis_mock:
+    with patch.object(resources, '_cache') as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr('src.services.limiter.RateLimiter.script', AsyncMock(return_value=[1, 9, 0, 0]))
         current_user = session.query(User).filter_by(email=user.get('email')).first()
         contact['user_id'] = current_user.id
         response = client.post(
@@ -30,11 +25,9 @@ def test_add_contact(client, session, token, user, contact, monkeypatch):
 
 
 def test_get_contacts(client, session, token, contact, monkeypatch):
-    with patch.object(authtoken, 'r') as redis_mock:
+    with patch.object(resources, '_cache') as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr('src.services.limiter.RateLimiter.script', AsyncMock(return_value=[1, 9, 0, 0]))
 
         response = client.get(
             "/api/contacts/",
@@ -47,11 +40,9 @@ def test_get_contacts(client, session, token, contact, monkeypatch):
 
 
 def test_search_contact(client, session, token, contact, monkeypatch):
-    with patch.object(authtoken, 'r') as redis_mock:
+    with patch.object(resources, '_cache') as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr('src.services.limiter.RateLimiter.script', AsyncMock(return_value=[1, 9, 0, 0]))
 
         response = client.get(
             "/api/contacts/search/",
@@ -64,11 +55,9 @@ def test_search_contact(client, session, token, contact, monkeypatch):
 
 
 def test_put_contact(client, session, token, user, contact, monkeypatch):
-    with patch.object(authtoken, 'r') as redis_mock:
+    with patch.object(resources, '_cache') as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr('src.services.limiter.RateLimiter.script', AsyncMock(return_value=[1, 9, 0, 0]))
 
         test_contact = session.query(Contact).filter_by(email=contact.get("email")).first()
         body = contact.copy()
@@ -83,11 +72,9 @@ def test_put_contact(client, session, token, user, contact, monkeypatch):
 
 
 def test_delete_contact(client, session, token, user, contact, monkeypatch):
-    with patch.object(authtoken, 'r') as redis_mock:
+    with patch.object(resources, '_cache') as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr('src.services.limiter.RateLimiter.script', AsyncMock(return_value=[1, 9, 0, 0]))
 
         test_contact = session.query(Contact).filter_by(first_name=contact.get("first_name")).first()
         client.delete(
@@ -98,3 +85,48 @@ def test_delete_contact(client, session, token, user, contact, monkeypatch):
         assert try_find == None
 
 
+def test_duplicates(client, session, token, user, monkeypatch):
+    with patch.object(resources, '_cache') as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr('src.services.limiter.RateLimiter.script', AsyncMock(return_value=[1, 9, 0, 0]))
+        headers = {'Authorization': f'Bearer {token["access_token"]}'}
+        current_user = session.query(User).filter_by(email=user.get('email')).first()
+        first = {"first_name": "Olena", "last_name": "Melnyk", "email": "olena.melnyk+work@example.com",
+                 "phone_number": "+380 67 123 45 67", "birthday": "1900-01-01", "address": "",
+                 "user_id": current_user.id}
+        second = {**first, "first_name": "Melnyk", "last_name": "Olena", "email": "olena.melnyk@example.com",
+                  "phone_number": "067-123-45-67", "birthday": "1990-03-08", "address": "Kyiv"}
+        ids = [client.post("/api/contacts/", json=body, headers=headers).json()['id'] for body in (first, second)]
+
+        response = client.get("/api/contacts/duplicates", headers=headers)
+        assert response.status_code == 200, response.text
+        group = response.json()[0]
+        assert group['score'] == 1
+        assert group['keys'] == ['email_key', 'phone_e164', 'name_key']
+        assert [contact['id'] for contact in group['contacts']] == ids
+
+        response = client.post("/api/contacts/duplicates/merge", json={'keep': ids[0], 'merge': [ids[1]]},
+                               headers=headers)
+        assert response.status_code == 200, response.text
+        merged = response.json()
+        assert merged['birthday'] == '1990-03-08'
+        assert merged['address'] == 'Kyiv'
+        assert client.get(f"/api/contacts/{ids[1]}", headers=headers).status_code == 404
+        assert client.get("/api/contacts/duplicates", headers=headers).json() == []
+
+
+def test_get_contacts_by_phone(client, session, token, user, monkeypatch):
+    with patch.object(resources, '_cache') as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr('src.services.limiter.RateLimiter.script', AsyncMock(return_value=[1, 9, 0, 0]))
+        headers = {'Authorization': f'Bearer {token["access_token"]}'}
+        current_user = session.query(User).filter_by(email=user.get('email')).first()
+        body = {"first_name": "Taras", "last_name": "Boiko", "email": "taras@example.com",
+                "phone_number": "(093) 765-43-21", "address": "Lviv", "user_id": current_user.id}
+        contact_id = client.post("/api/contacts/", json=body, headers=headers).json()['id']
+
+        response = client.get("/api/contacts/by-phone/+380937654321", headers=headers)
+        assert response.status_code == 200, response.text
+        assert [contact['id'] for contact in response.json()] == [contact_id]
+        assert client.get("/api/contacts/by-phone/0937654320", headers=headers).json() == []
+        assert client.get("/api/contacts/by-phone/abc", headers=headers).status_code == 422
@@ -0,0 +1,11 @@
+import pytest
+
+from src.services import metrics
+
+
+@pytest.mark.skipif(metrics.REGISTRY is None, reason='prometheus_client is not installed')
+def test_metrics(client, token):
+    response = client.get("/metrics")
+    assert response.status_code == 200, response.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/auth/login",status="2xx"}' in response.text
+    assert metrics.REGISTRY.get_sample_value('bcrypt_queue_seconds_count') > 0
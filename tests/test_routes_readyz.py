@@ -0,0 +1,17 @@
+from src.services.warmup import warmup
+
+
+def test_readyz_cold(client):
+    response = client.get("/readyz")
+    assert response.status_code == 503, response.text
+    assert response.json()["ready"] is False
+
+
+def test_readyz_ready(client):
+    warmup.ready = True
+    try:
+        response = client.get("/readyz")
+    finally:
+        warmup.ready = False
+    assert response.status_code == 200, response.text
+    assert response.json()["ready"] is True
@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from sqlalchemy.orm import Session
+
+from src.database.models import EmailOutbox
+from src.repository.outbox import (
+    claim_emails,
+    enqueue_email,
+    get_pending_emails,
+    mark_sent,
+    mark_failed,
+)
+
+
+class TestOutbox(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.session = MagicMock(spec=Session)
+
+    async def test_enqueue_email(self):
+        self.session.query().filter_by().first.return_value = None
+        result = await enqueue_email('confirm_email', 'example@mail.com', 'Test', 'http://localhost/', self.session)
+        self.session.add.assert_called_once_with(result)
+        self.assertEqual(result.kind, 'confirm_email')
+        self.assertEqual(result.email, 'example@mail.com')
+
+    async def test_enqueue_email_dedup(self):
+        message = EmailOutbox(kind='confirm_email', email='example@mail.com', username='Old', host='http://old/')
+        self.session.query().filter_by().first.return_value = message
+        result = await enqueue_email('confirm_email', 'example@mail.com', 'Test', 'http://localhost/', self.session)
+        self.session.add.assert_not_called()
+        self.assertIs(result, message)
+        self.assertEqual(result.host, 'http://localhost/')
+
+    async def test_get_pending_emails(self):
+        messages = [EmailOutbox(), EmailOutbox()]
+        self.session.query().filter().order_by().limit().with_for_update().all.return_value = messages
+        result = await get_pending_emails(limit=10, db=self.session)
+        self.assertEqual(result, messages)
+
+    async def test_claim_emails(self):
+        messages = [EmailOutbox(status='pending'), EmailOutbox(status='pending')]
+        self.session.query().filter().order_by().limit().with_for_update().all.return_value = messages
+        result = await claim_emails(limit=10, timeout=60, db=self.session)
+        self.assertEqual(result, messages)
+        self.assertEqual({message.status for message in messages}, {'sending'})
+        self.assertGreater(messages[0].next_attempt_at, datetime.utcnow())
+
+    async def test_mark_sent(self):
+        message = EmailOutbox(attempts=0)
+        await mark_sent(message, self.session)
+        self.assertEqual(message.status, 'sent')
+        self.assertIsNotNone(message.sent_at)
+
+    async def test_mark_failed_backoff(self):
+        message = EmailOutbox(status='sending', attempts=1)
+        await mark_failed(message, 'error', max_attempts=5, backoff=10, db=self.session)
+        self.assertEqual(message.status, 'pending')
+        self.assertEqual(message.attempts, 2)
+        delay = (message.next_attempt_at - datetime.utcnow()).total_seconds()
+        self.assertTrue(18 < delay <= 20)
+
+    async def test_mark_failed_gives_up(self):
+        message = EmailOutbox(status='pending', attempts=4)
+        await mark_failed(message, 'error', max_attempts=5, backoff=10, db=self.session)
+        self.assertEqual(message.status, 'failed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+from sqlalchemy.orm import Session
+
+from src.database.models import UserSession
+from src.repository.sessions import (
+    hash_token,
+    add_session,
+    get_session,
+    revoke_session,
+    revoke_user_sessions,
+    delete_expired_sessions,
+)
+
+
+class TestSessions(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.session = MagicMock(spec=Session)
+
+    async def test_add_session(self):
+        expires_at = datetime.utcnow() + timedelta(minutes=30)
+        result = await add_session(user=1, refresh_token='refresh', expires_at=expires_at, db=self.session)
+        self.session.add.assert_called_once_with(result)
+        self.session.commit.assert_not_called()
+        self.assertEqual(result.user_id, 1)
+        self.assertEqual(result.token_hash, hash_token('refresh'))
+        self.assertNotEqual(result.token_hash, 'refresh')
+
+    async def test_get_session(self):
+        session = UserSession(user_id=1)
+        self.session.query().filter().first.return_value = session
+        result = await get_session(refresh_token='refresh', db=self.session)
+        self.assertEqual(result, session)
+
+    async def test_get_session_not_found(self):
+        self.session.query().filter().first.return_value = None
+        result = await get_session(refresh_token='refresh', db=self.session)
+        self.assertIsNone(result)
+
+    async def test_revoke_session(self):
+        session = UserSession(user_id=1)
+        await revoke_session(session=session, db=self.session)
+        self.session.delete.assert_called_once_with(session)
+        self.session.commit.assert_not_called()
+
+    async def test_revoke_user_sessions(self):
+        self.session.query().filter().delete.return_value = 3
+        result = await revoke_user_sessions(user=1, db=self.session)
+        self.assertEqual(result, 3)
+
+    async def test_delete_expired_sessions(self):
+        self.session.query().filter().delete.return_value = 2
+        result = await delete_expired_sessions(user=1, db=self.session)
+        self.assertEqual(result, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,6 @@ from src.repository.user import (
     get_user_by_email,
     get_user_by_id,
     add_user,
-    update_token,
     update_reset_token,
     update_password,
     verify_email,
@@ -44,11 +43,9 @@ class TestUser(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.username, user.username)
         self.assertEqual(result.email, user.email)
         self.assertEqual(result.password, user.password)
-
-    async def test_update_token(self):
-        user = User()
-        await update_token(user=user, refresh_token='refresh', db=self.session)
-        self.assertEqual(user.refresh_token, 'refresh')
+        self.assertIsNone(result.avatar)
+        self.session.flush.assert_called_once()
+        self.session.commit.assert_not_called()
 
     async def test_update_reset_token(self):
         user = User()
@@ -59,6 +56,7 @@ class TestUser(unittest.IsolatedAsyncioTestCase):
         user = User()
         await update_password(user=user, new_password='123456', db=self.session)
         self.assertEqual(user.password, '123456')
+        self.session.commit.assert_not_called()
 
     async def test_verify_email(self):
         user = User()
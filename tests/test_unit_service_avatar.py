@@ -0,0 +1,156 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import redis
+
+from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import Base, User, AvatarJob
+from src.services.avatar import AvatarUploader, UploadLimitMiddleware, sniff_image_type
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'image'
+
+
+class TestUploadValidation(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+
+        @app.post('/avatar')
+        async def upload(file: UploadFile = File()):
+            return {'size': len(await file.read())}
+
+        app.add_middleware(UploadLimitMiddleware, path='/avatar', max_size=100)
+        self.client = TestClient(app)
+
+    def test_sniff_image_type(self):
+        self.assertEqual(sniff_image_type(b'\xff\xd8\xff\xe0'), 'jpeg')
+        self.assertEqual(sniff_image_type(PNG), 'png')
+        self.assertEqual(sniff_image_type(b'RIFF\x00\x00\x00\x00WEBPVP8 '), 'webp')
+        self.assertEqual(sniff_image_type(b'\x00\x00\x00\x1cftypavif'), 'avif')
+        self.assertIsNone(sniff_image_type(b'GIF90a'))
+
+    def test_small_upload_passes(self):
+        response = self.client.post('/avatar', files={'file': ('a.png', PNG)})
+        self.assertEqual(response.status_code, 200, response.text)
+
+    def test_declared_length_rejected(self):
+        response = self.client.post('/avatar', files={'file': ('a.png', PNG + b'0' * 20000)})
+        self.assertEqual(response.status_code, 413, response.text)
+
+    def test_streamed_body_rejected(self):
+        def body():
+            yield b'0' * 10000
+            yield b'0' * 10000
+
+        response = self.client.post('/avatar', content=body(),
+                                    headers={'Content-Type': 'multipart/form-data; boundary=x'})
+        self.assertEqual(response.status_code, 413, response.text)
+
+
+class TestAvatarUploader(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.session_factory = sessionmaker(bind=engine)
+        db = self.session_factory()
+        db.add(User(id=1, email='example@mail.com', password='qwerty'))
+        db.add(AvatarJob(id='job', user_id=1, status='pending'))
+        db.commit()
+        db.close()
+
+        self.storage = MagicMock()
+        self.storage.get_name.return_value = 'name'
+        self.storage.store = AsyncMock(return_value='fake.url')
+        self.uploader = AvatarUploader(self.storage, session_factory=self.session_factory, chunk_size=4)
+
+        patcher = patch('src.services.avatar.read_router')
+        self.read_router = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_save(self):
+        path, digest = await self.uploader.save(UploadFile(filename='a.png', file=io.BytesIO(PNG)))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), PNG)
+        self.assertEqual(digest, hashlib.sha256(PNG).hexdigest())
+        os.remove(path)
+
+    async def test_save_rejects_unknown_type(self):
+        with self.assertRaises(HTTPException) as err:
+            await self.uploader.save(UploadFile(filename='a.png', file=io.BytesIO(b'<html></html>')))
+        self.assertEqual(err.exception.status_code, 415)
+
+    async def test_save_rejects_large_file(self):
+        self.uploader.max_size = 10
+        with self.assertRaises(HTTPException) as err:
+            await self.uploader.save(UploadFile(filename='a.png', file=io.BytesIO(PNG + b'0' * 10)))
+        self.assertEqual(err.exception.status_code, 413)
+
+    async def test_save_removes_file_on_error(self):
+        file = UploadFile(filename='a.png', file=io.BytesIO(PNG))
+        file.read = AsyncMock(side_effect=[PNG, OSError('connection reset')])
+        created = []
+        named_temporary_file = tempfile.NamedTemporaryFile
+
+        def spy(*args, **kwargs):
+            tmp = named_temporary_file(*args, **kwargs)
+            created.append(tmp.name)
+            return tmp
+
+        with patch('src.services.avatar.tempfile.NamedTemporaryFile', spy):
+            with self.assertRaises(OSError):
+                await self.uploader.save(file)
+        self.assertEqual(len(created), 1)
+        self.assertFalse(os.path.exists(created[0]))
+
+    async def test_process(self):
+        path, digest = await self.uploader.save(UploadFile(filename='a.png', file=io.BytesIO(PNG)))
+        await self.uploader.process('job', 1, path, digest)
+        self.storage.store.assert_awaited_once_with(path, 'name')
+        self.assertFalse(os.path.exists(path))
+
+        db = self.session_factory()
+        self.assertEqual(db.get(AvatarJob, 'job').status, 'done')
+        self.assertEqual(db.get(AvatarJob, 'job').avatar, 'fake.url')
+        self.assertEqual(db.get(User, 1).avatar, 'fake.url')
+        self.assertEqual(db.get(User, 1).avatar_hash, digest)
+        db.close()
+        self.read_router.record_write.assert_called_once()
+        self.assertEqual(self.read_router.record_write.call_args.args[0], 1)
+
+    async def test_process_record_write_failed(self):
+        self.read_router.record_write.side_effect = redis.ConnectionError('redis is down')
+        path, digest = await self.uploader.save(UploadFile(filename='a.png', file=io.BytesIO(PNG)))
+        with self.assertLogs('src.services.avatar', level='WARNING'):
+            await self.uploader.process('job', 1, path, digest)
+
+        db = self.session_factory()
+        self.assertEqual(db.get(AvatarJob, 'job').status, 'done')
+        self.assertEqual(db.get(User, 1).avatar, 'fake.url')
+        db.close()
+        self.assertFalse(os.path.exists(path))
+
+    async def test_process_failed(self):
+        self.storage.store.side_effect = RuntimeError('storage is down')
+        path, digest = await self.uploader.save(UploadFile(filename='a.png', file=io.BytesIO(PNG)))
+        await self.uploader.process('job', 1, path, digest)
+
+        db = self.session_factory()
+        job = db.get(AvatarJob, 'job')
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'storage is down')
+        self.assertIsNone(db.get(User, 1).avatar)
+        db.close()
+        self.read_router.record_write.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import Base, Contact, EmailOutbox, User
+from src.repository.contacts import EMPTY_BIRTHDAY
+from src.services.birthdays import BirthdayDigestJob, birthday_window
+from src.services.email import Mailer, birthday_digest_message
+
+
+def contact(user_id, first_name, birthday):
+    return Contact(user_id=user_id, first_name=first_name, last_name='Test', email=f'{first_name}@mail.com',
+                   phone_number='0671234567', birthday=birthday)
+
+
+class TestBirthdayWindow(unittest.TestCase):
+
+    def test_new_year(self):
+        window = birthday_window(date(2026, 12, 29), 7)
+        self.assertEqual(len(window), 8)
+        self.assertEqual(window[1231], date(2026, 12, 31))
+        self.assertEqual(window[105], date(2027, 1, 5))
+
+    def test_leap_day(self):
+        self.assertEqual(birthday_window(date(2027, 2, 27), 2)[229], date(2027, 3, 1))
+        self.assertNotIn(229, birthday_window(date(2028, 2, 27), 1))
+
+
+class TestBirthdayDigestJob(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.session_factory = sessionmaker(bind=engine)
+        db = self.session_factory()
+        db.add_all([User(id=1, username='first', email='first@mail.com', password='x', email_confirm=True),
+                    User(id=2, username='second', email='second@mail.com', password='x', email_confirm=True),
+                    User(id=3, username='third', email='third@mail.com', password='x', email_confirm=False)])
+        db.add_all([contact(1, 'Ann', date(1990, 1, 3)),
+                    contact(1, 'Bob', date(1985, 12, 30)),
+                    contact(1, 'Cid', date(1985, 12, 20)),
+                    contact(1, 'Dan', EMPTY_BIRTHDAY),
+                    contact(1, 'Eve', None),
+                    contact(2, 'Fay', date(2000, 1, 1)),
+                    contact(3, 'Gus', date(2000, 1, 1))])
+        db.commit()
+        db.close()
+
+    def digests(self):
+        db = self.session_factory()
+        messages = {(message.email, message.payload['date']): message
+                    for message in db.query(EmailOutbox).filter_by(kind='birthday_digest')}
+        db.close()
+        return messages
+
+    def names(self, message):
+        return [item['first_name'] for item in message.payload['contacts']]
+
+    async def test_run(self):
+        job = BirthdayDigestJob(session_factory=self.session_factory, days=7, chunk_size=1, host='http://x/')
+        self.assertEqual(await job.run(date(2026, 12, 28)), 2)
+        self.assertEqual(job.contacts, 3)
+        self.assertEqual(job.queued, 2)
+        digests = self.digests()
+        self.assertEqual(set(digests), {('first@mail.com', '2026-12-28'), ('second@mail.com', '2026-12-28')})
+        self.assertEqual([(item['first_name'], item['birthday'])
+                          for item in digests['first@mail.com', '2026-12-28'].payload['contacts']],
+                         [('Bob', '2026-12-30'), ('Ann', '2027-01-03')])
+        self.assertEqual(digests['second@mail.com', '2026-12-28'].payload['contacts'][0]['birthday'], '2027-01-01')
+
+    async def test_rerun_updates_pending(self):
+        await BirthdayDigestJob(session_factory=self.session_factory).run(date(2026, 12, 28))
+        db = self.session_factory()
+        db.query(Contact).filter_by(first_name='Ann').delete()
+        db.commit()
+        db.close()
+        job = BirthdayDigestJob(session_factory=self.session_factory)
+        await job.run(date(2026, 12, 28))
+        self.assertEqual(job.queued, 0)
+        digests = self.digests()
+        self.assertEqual(len(digests), 2)
+        self.assertEqual(self.names(digests['first@mail.com', '2026-12-28']), ['Bob'])
+
+    async def test_rerun_after_sent(self):
+        await BirthdayDigestJob(session_factory=self.session_factory).run(date(2026, 12, 28))
+        db = self.session_factory()
+        db.query(EmailOutbox).filter_by(email='first@mail.com').update({'status': 'sent'})
+        db.query(Contact).filter_by(first_name='Ann').delete()
+        db.commit()
+        db.close()
+        job = BirthdayDigestJob(session_factory=self.session_factory)
+        await job.run(date(2026, 12, 28))
+        self.assertEqual(job.queued, 0)
+        digests = self.digests()
+        self.assertEqual(len(digests), 2)
+        self.assertEqual(digests['first@mail.com', '2026-12-28'].status, 'sent')
+        self.assertEqual(self.names(digests['first@mail.com', '2026-12-28']), ['Bob', 'Ann'])
+
+    async def test_next_day_keeps_pending(self):
+        await BirthdayDigestJob(session_factory=self.session_factory).run(date(2026, 12, 28))
+        job = BirthdayDigestJob(session_factory=self.session_factory, days=1)
+        await job.run(date(2026, 12, 30))
+        self.assertEqual(job.queued, 1)
+        digests = self.digests()
+        self.assertEqual(len(digests), 3)
+        self.assertEqual(self.names(digests['first@mail.com', '2026-12-28']), ['Bob', 'Ann'])
+        self.assertEqual(self.names(digests['first@mail.com', '2026-12-30']), ['Bob'])
+
+    async def test_message(self):
+        payload = {'contacts': [{'first_name': 'Bob', 'last_name': 'Test', 'birthday': '2026-12-30'}]}
+        message, template_name = await birthday_digest_message('first@mail.com', 'first', 'http://x/', payload)
+        self.assertEqual(message.subject, 'Upcoming birthdays: 1')
+        body = Mailer().get_template(template_name).render(**message.template_body)
+        self.assertIn('2026-12-30 - Bob Test', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from src.database.models import Contact
+from src.services.duplicates import blocking_keys, find_groups, normalize_email, normalize_name
+
+
+def contact(contact_id, email_key=None, phone_e164=None, name_key=None):
+    return Contact(id=contact_id, email_key=email_key, phone_e164=phone_e164, name_key=name_key)
+
+
+class TestNormalize(unittest.TestCase):
+
+    def test_email(self):
+        self.assertEqual(normalize_email(' Olena.Melnyk+news@Example.com '), 'olena.melnyk@example.com')
+        self.assertEqual(normalize_email('o.melnyk@googlemail.com'), 'omelnyk@gmail.com')
+        self.assertIsNone(normalize_email('not an email'))
+
+    def test_phone(self):
+        self.assertEqual(blocking_keys('', '', '', '+380 (67) 123-45-67')['phone_e164'], '+380671234567')
+        self.assertEqual(blocking_keys('', '', '', '067 123 45 67')['phone_e164'], '+380671234567')
+        self.assertIsNone(blocking_keys('', '', '', '12-34')['phone_e164'])
+
+    def test_name(self):
+        self.assertEqual(normalize_name('Olena', 'Melnyk'), normalize_name('MELNYK', 'olena'))
+        self.assertEqual(normalize_name('Zoë', 'Brontë'), 'bronte zoe')
+        self.assertIsNone(normalize_name('', ' '))
+
+
+class TestFindGroups(unittest.TestCase):
+
+    def test_groups_are_joined_across_keys(self):
+        contacts = [
+            contact(1, email_key='a@example.com', name_key='olena melnyk'),
+            contact(2, email_key='a@example.com', phone_e164='+380671234567'),
+            contact(3, phone_e164='+380671234567'),
+            contact(4, name_key='petro boiko'),
+            contact(5, name_key='petro boiko'),
+        ]
+        groups = find_groups(contacts)
+        self.assertEqual([[c.id for c in group['contacts']] for group in groups], [[1, 2, 3], [4, 5]])
+        self.assertEqual(groups[0]['score'], 0.5)
+        self.assertEqual(groups[0]['keys'], ['email_key', 'phone_e164'])
+        self.assertEqual(groups[1]['score'], 0.15)
+
+    def test_min_score(self):
+        contacts = [contact(1, name_key='petro boiko'), contact(2, name_key='petro boiko')]
+        self.assertEqual(find_groups(contacts, min_score=0.3), [])
+
+    def test_missing_keys_do_not_match(self):
+        self.assertEqual(find_groups([contact(1), contact(2)]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
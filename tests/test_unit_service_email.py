@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import aiosmtplib
+from fastapi_mail import MessageSchema, MessageType
+
+from src.services.email import Mailer, get_mail_config
+
+
+class TestMailer(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.mailer = Mailer(get_mail_config(), pool_size=1)
+
+    def get_message(self):
+        return MessageSchema(
+            subject="Confirm your email",
+            recipients=['example@mail.com'],
+            template_body={"host": 'http://localhost/', "username": 'Test', "token": 'token'},
+            subtype=MessageType.html
+        )
+
+    def test_template_is_cached(self):
+        template = self.mailer.get_template('email_template.html')
+        self.assertIs(self.mailer.get_template('email_template.html'), template)
+
+    async def test_build_message(self):
+        msg = await self.mailer.build_message(self.get_message(), 'email_template.html')
+        self.assertEqual(msg['To'], 'example@mail.com')
+        self.assertEqual(msg['Subject'], 'Confirm your email')
+        self.assertIn('confirmed_email/token', msg.get_payload()[0].get_payload(decode=True).decode())
+
+    async def test_build_message_headers(self):
+        message = self.get_message()
+        message.cc = ['copy@mail.com']
+        message.headers = {'X-Kind': 'confirm_email'}
+        msg = await self.mailer.build_message(message, 'email_template.html')
+        self.assertEqual(msg['Cc'], 'copy@mail.com')
+        self.assertEqual(msg['X-Kind'], 'confirm_email')
+        self.assertTrue(msg['Message-ID'])
+
+    async def test_session_is_reused(self):
+        smtp = MagicMock(is_connected=True, send_message=AsyncMock())
+        with patch.object(self.mailer, 'connect', AsyncMock(return_value=smtp)) as connect:
+            await self.mailer.send_message(self.get_message(), 'email_template.html')
+            await self.mailer.send_message(self.get_message(), 'email_template.html')
+        connect.assert_awaited_once()
+        self.assertEqual(smtp.send_message.await_count, 2)
+
+    async def test_reconnect_on_disconnect(self):
+        dead = MagicMock(is_connected=True, send_message=AsyncMock(side_effect=aiosmtplib.SMTPServerDisconnected('gone')))
+        alive = MagicMock(is_connected=True, send_message=AsyncMock())
+        with patch.object(self.mailer, 'connect', AsyncMock(side_effect=[dead, alive])) as connect:
+            await self.mailer.send_message(self.get_message(), 'email_template.html')
+        self.assertEqual(connect.await_count, 2)
+        dead.close.assert_called_once()
+        alive.send_message.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
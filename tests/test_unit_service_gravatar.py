@@ -0,0 +1,15 @@
+import unittest
+
+from src.services.gravatar import gravatar_url
+
+
+class TestGravatar(unittest.TestCase):
+
+    def test_gravatar_url(self):
+        self.assertEqual(gravatar_url(' Example@Mail.com '), gravatar_url('example@mail.com'))
+        self.assertEqual(gravatar_url('Example@Mail.com '),
+                         'https://www.gravatar.com/avatar/fbf2b9cfc0a472389f3620e471bdf0e9')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException, Response
+from redis.exceptions import RedisError
+
+from src.services.limiter import RateLimiter, LocalBuckets
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.limiter = RateLimiter(times=10, seconds=5, group='contacts')
+
+    def test_rate(self):
+        self.assertEqual(self.limiter.rate, 10 / 5000)
+
+    def test_get_key(self):
+        self.assertEqual(self.limiter.get_key(1), 'ratelimit:contacts:1')
+
+    async def test_allowed(self):
+        script = AsyncMock(return_value=[1, 9, 500, 0])
+        response = Response()
+        with patch.object(RateLimiter, 'script', script):
+            await self.limiter(response=response, user=1)
+        script.assert_awaited_once_with(keys=['ratelimit:contacts:1'], args=[10, 10 / 5000, 1])
+        self.assertEqual(response.headers['RateLimit-Limit'], '10')
+        self.assertEqual(response.headers['RateLimit-Remaining'], '9')
+        self.assertEqual(response.headers['RateLimit-Reset'], '1')
+
+    async def test_rejected(self):
+        script = AsyncMock(return_value=[0, 0, 5000, 1500])
+        with patch.object(RateLimiter, 'script', script):
+            with self.assertRaises(HTTPException) as err:
+                await self.limiter(response=Response(), user=1)
+        self.assertEqual(err.exception.status_code, 429)
+        self.assertEqual(err.exception.headers['Retry-After'], '2')
+        self.assertEqual(err.exception.headers['RateLimit-Remaining'], '0')
+
+    async def test_off(self):
+        script = AsyncMock()
+        response = Response()
+        with patch.object(RateLimiter, 'script', script), patch.object(RateLimiter, 'enabled', True):
+            await RateLimiter.init(AsyncMock(), mode='off')
+            self.assertFalse(RateLimiter.enabled)
+            await self.limiter(response=response, user=1)
+        script.assert_not_awaited()
+        self.assertNotIn('RateLimit-Limit', response.headers)
+
+
+class TestLocalBuckets(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.buckets = LocalBuckets(interval=0.25, error=0.1)
+        self.buckets.now = lambda: 0
+
+    def test_take_over_admission(self):
+        results = [self.buckets.take('key', capacity=10, rate=0.002)[0] for _ in range(12)]
+        self.assertEqual(results, [1] * 11 + [0])
+        self.assertEqual(self.buckets.buckets['key'].pending, 11)
+
+    async def test_sync(self):
+        for _ in range(3):
+            self.buckets.take('key', capacity=10, rate=0.002)
+        self.buckets.script = AsyncMock(return_value=[b'4.5'])
+        await self.buckets.sync()
+        self.buckets.script.assert_awaited_once_with(keys=['key'], args=[10, 0.002, 3])
+        bucket = self.buckets.buckets['key']
+        self.assertEqual(bucket.pending, 0)
+        self.assertEqual(bucket.tokens, 4.5)
+
+    async def test_sync_failure_keeps_pending(self):
+        self.buckets.take('key', capacity=10, rate=0.002)
+        self.buckets.script = AsyncMock(side_effect=RedisError)
+        await self.buckets.sync()
+        self.assertEqual(self.buckets.buckets['key'].pending, 1)
+
+    def test_take_retry_after_allowance(self):
+        for _ in range(11):
+            self.buckets.take('key', capacity=10, rate=0.002)
+        # one token below zero and the allowed error is one token, so the next request waits for one token
+        self.assertEqual(self.buckets.take('key', capacity=10, rate=0.002), (0, 0, 5000, 500))
+
+    async def test_cancelled_sync_keeps_pending(self):
+        self.buckets.take('key', capacity=10, rate=0.002)
+        self.buckets.script = AsyncMock(side_effect=asyncio.CancelledError)
+        with self.assertRaises(asyncio.CancelledError):
+            await self.buckets.sync()
+        self.assertEqual(self.buckets.buckets['key'].pending, 1)
+
+    async def test_run_survives_errors(self):
+        self.buckets.interval = 0
+        self.buckets.take('key', capacity=10, rate=0.002)
+        self.buckets.script = AsyncMock(side_effect=[ValueError('bad reply'), [b'9']])
+        self.buckets.task = asyncio.create_task(self.buckets.run())
+        while self.buckets.script.await_count < 2:
+            await asyncio.sleep(0)
+        self.buckets.script.side_effect = None
+        self.buckets.script.return_value = [b'9']
+        await self.buckets.stop()
+        self.assertIsNone(self.buckets.task)
+        self.assertEqual(self.buckets.buckets['key'].tokens, 9)
+
+    async def test_limiter_uses_local_buckets(self):
+        limiter = RateLimiter(times=10, seconds=5, group='contacts')
+        script = AsyncMock()
+        response = Response()
+        with patch.object(RateLimiter, 'script', script), patch.object(RateLimiter, 'buckets', self.buckets):
+            await limiter(response=response, user=1)
+        script.assert_not_awaited()
+        self.assertEqual(response.headers['RateLimit-Remaining'], '9')
+
+
+if __name__ == '__main__':
+    unittest.main()
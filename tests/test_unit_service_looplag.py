@@ -0,0 +1,41 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from src.services.looplag import LoopLagMonitor
+
+
+class TestLoopLagMonitor(unittest.IsolatedAsyncioTestCase):
+
+    def block_the_loop(self):
+        time.sleep(0.3)
+
+    async def test_lag_is_recorded(self):
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.05, debug=False)
+        with patch.object(monitor, 'record', wraps=monitor.record) as record, \
+                self.assertLogs('src.services.looplag', level='WARNING') as logs:
+            monitor.start()
+            await asyncio.sleep(0.05)
+            self.block_the_loop()
+            await asyncio.sleep(0.05)
+            await monitor.stop()
+        self.assertGreaterEqual(max(call.args[0] for call in record.call_args_list), 0.25)
+        self.assertIn('event loop was blocked', logs.output[0])
+        self.assertIsNone(monitor.watchdog)
+
+    async def test_debug_captures_stack(self):
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.05, debug=True)
+        with self.assertLogs('src.services.looplag', level='WARNING') as logs:
+            monitor.start()
+            await asyncio.sleep(0.05)
+            self.block_the_loop()
+            await asyncio.sleep(0.05)
+            await monitor.stop()
+        stacks = [line for line in logs.output if 'loop thread stack' in line]
+        self.assertEqual(len(stacks), 1)
+        self.assertIn('block_the_loop', stacks[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
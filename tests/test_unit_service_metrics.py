@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from src.services import metrics
+from src.services.resources import resources
+
+
+class TestCheckMetrics(unittest.TestCase):
+
+    def test_warns_without_prometheus_client(self):
+        with patch.object(metrics, 'REGISTRY', None), self.assertLogs(metrics.logger, 'WARNING'):
+            self.assertFalse(metrics.check_metrics())
+
+
+@unittest.skipIf(metrics.REGISTRY is None, 'prometheus_client is not installed')
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+
+        @app.get('/items/{item_id}')
+        def get_item(item_id: int):
+            return {'id': item_id}
+
+        self.app = metrics.MetricsMiddleware(app)
+        self.client = TestClient(self.app)
+
+    def sample(self, name, labels):
+        return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_latency_by_route_template(self):
+        labels = {'method': 'GET', 'route': '/items/{item_id}', 'status': '2xx'}
+        before = self.sample('http_request_duration_seconds_count', labels)
+        self.client.get('/items/1')
+        self.client.get('/items/2')
+        self.assertEqual(self.sample('http_request_duration_seconds_count', labels), before + 2)
+        self.assertEqual(len(self.app.children), 1)
+
+    def test_unmatched_route(self):
+        labels = {'method': 'GET', 'route': metrics.UNMATCHED_ROUTE, 'status': '4xx'}
+        before = self.sample('http_request_duration_seconds_count', labels)
+        self.client.get('/nowhere/1')
+        self.assertEqual(self.sample('http_request_duration_seconds_count', labels), before + 1)
+        self.assertEqual(self.sample('http_requests_in_flight', {}), 0)
+
+    def test_database_pool(self):
+        engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'metrics.db')}", pool_size=2)
+        with patch.object(resources, '_engine', engine):
+            connection = engine.connect()
+            self.assertEqual(self.sample('db_pool_checked_out', {}), 1)
+            connection.close()
+            self.assertEqual(self.sample('db_pool_checked_out', {}), 0)
+            self.assertEqual(self.sample('db_pool_size', {}), 2)
+        engine.dispose()
+
+    def test_render_metrics(self):
+        body, content_type = metrics.render_metrics()
+        self.assertIn(b'bcrypt_queue_seconds', body)
+        self.assertTrue(content_type.startswith('text/plain'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from fastapi_mail import ConnectionConfig
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import Base, EmailOutbox
+from src.repository import outbox as repository_outbox
+from src.services.email import Mailer, get_mail_config
+from src.services.outbox import OutboxWorker
+
+
+class SMTPSink:
+    """
+    Minimal local SMTP server that accepts every message and keeps it in memory.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.sessions += 1
+        writer.write(b'220 sink ready\r\n')
+        while line := await reader.readline():
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                writer.write(b'250 sink\r\n')
+            elif command == 'DATA':
+                writer.write(b'354 go ahead\r\n')
+                await writer.drain()
+                data = b''
+                while (chunk := await reader.readline()) != b'.\r\n':
+                    data += chunk
+                self.messages.append(data)
+                writer.write(b'250 queued\r\n')
+            elif command == 'QUIT':
+                writer.write(b'221 bye\r\n')
+                await writer.drain()
+                break
+            else:
+                writer.write(b'250 ok\r\n')
+            await writer.drain()
+        writer.close()
+
+
+class TestOutboxWorker(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.sink = SMTPSink()
+        port = await self.sink.start()
+        config = ConnectionConfig(**{**get_mail_config().dict(), 'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': port,
+                                     'MAIL_SSL_TLS': False, 'USE_CREDENTIALS': False})
+        self.mailer = Mailer(config, pool_size=1)
+
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.session_factory = sessionmaker(bind=engine)
+        db = self.session_factory()
+        db.add_all([EmailOutbox(kind='confirm_email', email=f'user{i}@mail.com', username='Test', host='http://x/')
+                    for i in range(3)])
+        db.commit()
+        db.close()
+
+    async def asyncTearDown(self):
+        await self.mailer.close()
+        await self.sink.stop()
+
+    async def test_drain_batch_over_one_session(self):
+        worker = OutboxWorker(self.mailer, session_factory=self.session_factory, batch_size=10)
+        self.assertEqual(await worker.drain_once(), 3)
+        self.assertEqual(len(self.sink.messages), 3)
+        self.assertEqual(self.sink.sessions, 1)
+        self.assertEqual(worker.sent, 3)
+
+        db = self.session_factory()
+        self.assertEqual(db.query(EmailOutbox).filter_by(status='sent').count(), 3)
+        db.close()
+        self.assertEqual(await worker.drain_once(), 0)
+
+    async def test_retry_on_failure(self):
+        worker = OutboxWorker(self.mailer, session_factory=self.session_factory, batch_size=10, backoff=60)
+        worker.send = MagicMock(side_effect=ConnectionError('down'))
+        self.assertEqual(await worker.drain_once(), 3)
+        self.assertEqual(worker.retried, 3)
+
+        db = self.session_factory()
+        message = db.query(EmailOutbox).first()
+        self.assertEqual(message.status, 'pending')
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.last_error, 'down')
+        db.close()
+        self.assertEqual(await worker.drain_once(), 0)
+
+    async def test_outcome_committed_per_message(self):
+        worker = OutboxWorker(self.mailer, session_factory=self.session_factory, batch_size=10, claim_timeout=60)
+        sent = worker.send
+        calls = []
+
+        async def send(message):
+            calls.append(message.email)
+            if len(calls) == 2:
+                raise SystemExit()
+            await sent(message)
+
+        worker.send = send
+        with self.assertRaises(SystemExit):
+            await worker.drain_once()
+
+        db = self.session_factory()
+        statuses = [message.status for message in db.query(EmailOutbox).order_by(EmailOutbox.id)]
+        self.assertEqual(statuses, ['sent', 'sending', 'sending'])
+        db.close()
+        self.assertEqual(await worker.drain_once(), 0)
+
+        db = self.session_factory()
+        db.query(EmailOutbox).filter_by(status='sending').update({'next_attempt_at': datetime.utcnow()})
+        db.commit()
+        db.close()
+        self.assertEqual(await worker.drain_once(), 2)
+        self.assertEqual(len(self.sink.messages), 3)
+
+
+    async def test_run_survives_errors(self):
+        worker = OutboxWorker(self.mailer, session_factory=self.session_factory, batch_size=10, poll_interval=0)
+        claim_emails = repository_outbox.claim_emails
+        calls = []
+
+        async def claim(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError('SELECT', {}, Exception('database is down'))
+            return await claim_emails(*args)
+
+        with patch.object(repository_outbox, 'claim_emails', claim):
+            task = asyncio.create_task(worker.run())
+            while worker.sent < 3:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertEqual(len(self.sink.messages), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from unittest.mock import patch
+
+from src.conf.config import settings
+from src.services.phone import to_e164
+
+
+class TestToE164(unittest.TestCase):
+
+    def test_formats_of_one_number(self):
+        for number in ('+380 67 123 45 67', '+380(67)123-45-67', '00380671234567', '067-123-45-67',
+                       '380671234567', '671234567'):
+            self.assertEqual(to_e164(number), '+380671234567', number)
+
+    def test_other_country(self):
+        self.assertEqual(to_e164('+1 (555) 010-9999'), '+15550109999')
+        self.assertEqual(to_e164('0044 20 7946 0000'), '+442079460000')
+
+    def test_country_code(self):
+        self.assertEqual(to_e164('030 1234567', country_code='49'), '+49301234567')
+
+    def test_country_code_setting(self):
+        with patch.object(settings, 'phone_default_country_code', '49'):
+            self.assertEqual(to_e164('030 1234567'), '+49301234567')
+
+    def test_not_a_number(self):
+        for number in (None, '', 'unknown', '12-34', '+1234567890123456'):
+            self.assertIsNone(to_e164(number), number)
+
+
+if __name__ == '__main__':
+    unittest.main()
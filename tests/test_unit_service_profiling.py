@@ -0,0 +1,67 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from src.services.profiling import ProfilingMiddleware
+
+
+def busy_handler():
+    deadline = time.perf_counter() + 0.3
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestProfilingMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.calls = 0
+
+        async def app(scope, receive, send):
+            self.calls += 1
+            busy_handler()
+            await asyncio.sleep(0.5)
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'{}'})
+
+        self.middleware = ProfilingMiddleware(app, secret='letmein', path=self.path, interval=0.001)
+
+    async def call(self, headers):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/contacts/', 'headers': headers}
+        await self.middleware(scope, None, send)
+        return messages
+
+    async def test_not_requested(self):
+        messages = await self.call([(b'x-profile', b'wrong')])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(messages[0]['headers'], [])
+        self.assertEqual(os.listdir(self.path), [])
+
+    async def test_profile_is_written(self):
+        messages = await self.call([(b'x-profile', b'letmein')])
+        filename = dict(messages[0]['headers'])[b'x-profile'].decode()
+        self.assertEqual(os.listdir(self.path), [filename])
+
+        with open(os.path.join(self.path, filename)) as f:
+            profile = json.load(f)
+        names = [frame['name'] for frame in profile['shared']['frames']]
+        samples = profile['profiles'][0]['samples']
+        self.assertEqual(profile['profiles'][0]['type'], 'sampled')
+        self.assertEqual(len(samples), len(profile['profiles'][0]['weights']))
+        self.assertEqual(names[samples[0][0]], 'ProfilingMiddleware.__call__')
+        busy = sum(1 for sample in samples if names[sample[-1]] == 'busy_handler')
+        self.assertGreater(busy, 10)
+        # the sleep is spent awaiting and is not sampled
+        self.assertLess(sum(profile['profiles'][0]['weights']), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
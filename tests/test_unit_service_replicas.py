@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from sqlalchemy import create_engine, text
+
+from src.services.replicas import ReadRouter, get_read_db
+from src.services.resources import Resources
+
+
+class TestReadRouter(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.primary = create_engine(f'sqlite:///{os.path.join(directory, "primary.db")}')
+        self.replicas = tuple(create_engine(f'sqlite:///{os.path.join(directory, f"replica{i}.db")}')
+                              for i in range(2))
+        self.resources = Resources(engine=self.primary)
+        self.resources._replicas = self.replicas
+        self.router = ReadRouter(self.resources, window=5, retry=30)
+        self.cache = MagicMock()
+
+    def tearDown(self):
+        for engine in (self.primary, *self.replicas):
+            engine.dispose()
+
+    def test_round_robin(self):
+        engines = []
+        for _ in range(4):
+            connection = self.router.connect()
+            engines.append(connection.engine)
+            connection.close()
+        self.assertEqual(engines, [*self.replicas, *self.replicas])
+
+    def test_unreachable_replica_is_skipped(self):
+        broken = create_engine('sqlite:////nonexistent/directory/replica.db')
+        self.resources._replicas = (broken, self.replicas[0])
+        with self.assertLogs('src.services.replicas', level='WARNING'):
+            connection = self.router.connect()
+        self.assertIs(connection.engine, self.replicas[0])
+        connection.close()
+        self.assertIn(broken, self.router.down_until)
+        for _ in range(2):
+            connection = self.router.connect()
+            self.assertIs(connection.engine, self.replicas[0])
+            connection.close()
+
+    def test_every_replica_down(self):
+        self.resources._replicas = (create_engine('sqlite:////nonexistent/directory/replica.db'),)
+        with self.assertLogs('src.services.replicas', level='WARNING'):
+            self.assertIsNone(self.router.connect())
+
+    def test_record_write(self):
+        self.router.record_write(1, self.cache)
+        self.cache.set.assert_called_once_with('read_your_writes:1', 1, px=5000)
+
+    def test_record_write_without_replicas(self):
+        self.resources._replicas = ()
+        self.router.record_write(1, self.cache)
+        self.cache.set.assert_not_called()
+
+
+class TestGetReadDb(unittest.TestCase):
+
+    def setUp(self):
+        self.primary_session = MagicMock()
+        self.cache = MagicMock()
+        self.replica = create_engine('sqlite://')
+        self.router = ReadRouter(Resources(), window=5, retry=30)
+
+    def tearDown(self):
+        self.replica.dispose()
+
+    def read_db(self):
+        from src.services import replicas
+
+        original = replicas.read_router
+        replicas.read_router = self.router
+        try:
+            self.dependency = get_read_db(1, self.primary_session, self.cache)
+            return next(self.dependency)
+        finally:
+            replicas.read_router = original
+
+    def test_no_replicas(self):
+        self.router.resources._replicas = ()
+        self.assertIs(self.read_db(), self.primary_session)
+        self.cache.exists.assert_not_called()
+
+    def test_recent_write_reads_primary(self):
+        self.router.resources._replicas = (self.replica,)
+        self.cache.exists.return_value = 1
+        self.assertIs(self.read_db(), self.primary_session)
+        self.cache.exists.assert_called_once_with('read_your_writes:1')
+
+    def test_replica_session(self):
+        self.router.resources._replicas = (self.replica,)
+        self.cache.exists.return_value = 0
+        session = self.read_db()
+        self.assertIsNot(session, self.primary_session)
+        self.assertEqual(session.execute(text('SELECT 1')).scalar(), 1)
+        self.assertIs(session.get_bind().engine, self.replica)
+        self.dependency.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy import create_engine, text
+
+from src.database.db import SessionLocal
+from src.services.resources import Resources
+
+
+class TestResources(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'resources.db')
+        self.engine = create_engine(f'sqlite:///{self.path}', pool_size=2)
+        self.resources = Resources(engine=self.engine, drain_timeout=0.2)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_pools_are_created_once(self):
+        self.assertIs(self.resources.redis, self.resources.redis)
+        self.assertIs(self.resources.cache, self.resources.cache)
+        self.assertIs(self.resources.mailer, self.resources.mailer)
+        self.assertIs(self.resources.engine, self.engine)
+
+    async def test_sessions_use_the_engine(self):
+        with patch('src.services.resources.resources', self.resources):
+            db = SessionLocal()
+            try:
+                self.assertIs(db.get_bind(), self.engine)
+                db.execute(text('SELECT 1'))
+                self.assertFalse(await self.resources.drain())
+            finally:
+                db.close()
+        self.assertTrue(await self.resources.drain())
+
+    async def test_drain(self):
+        connection = self.engine.connect()
+        self.assertFalse(await self.resources.drain())
+        connection.close()
+        self.assertTrue(await self.resources.drain())
+
+    async def test_close(self):
+        redis = self.resources._redis = MagicMock()
+        redis.close = AsyncMock()
+        redis.connection_pool.disconnect = AsyncMock()
+        cache = self.resources._cache = MagicMock()
+        mailer = self.resources._mailer = MagicMock()
+        mailer.close = AsyncMock()
+        await self.resources.close()
+        redis.close.assert_awaited_once()
+        cache.close.assert_called_once()
+        mailer.close.assert_awaited_once()
+        self.assertIsNone(self.resources._redis)
+        self.assertEqual(self.engine.pool.checkedin(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.services.cloudinary import LocalImageStorage
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestLocalImageStorage(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, 'upload.png')
+        Image.new('RGB', (400, 300), 'red').save(self.source)
+        self.storage = LocalImageStorage(os.path.join(self.tmp.name, 'avatars'), '/media/avatars',
+                                         sizes=[250, 64], formats=['webp', 'bogus'],
+                                         executor=ThreadPoolExecutor(1))
+
+    async def asyncTearDown(self):
+        await self.storage.close()
+        self.tmp.cleanup()
+
+    def test_unsupported_formats_are_dropped(self):
+        self.assertEqual(self.storage.formats, ['WEBP'])
+
+    async def test_store(self):
+        os.makedirs(self.storage.directory)
+        url = await self.storage.store(self.source, 'name')
+        self.assertTrue(url.startswith('/media/avatars/'))
+        self.assertTrue(url.endswith('_250.webp'))
+        files = sorted(os.listdir(self.storage.directory))
+        self.assertEqual(len(files), 2)
+        with Image.open(os.path.join(self.storage.directory, url.rsplit('/', 1)[1])) as image:
+            self.assertEqual(image.size, (250, 250))
+
+        self.assertEqual(await self.storage.store(self.source, 'name'), url)
+        self.assertEqual(sorted(os.listdir(self.storage.directory)), files)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import types
+import unittest
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from src.services.tracing import (
+    NULL_SPAN,
+    FileExporter,
+    Tracer,
+    TracingMiddleware,
+    instrument_module,
+    instrument_sql,
+    tracer,
+)
+
+
+class ListExporter:
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def close(self):
+        pass
+
+
+class TestTracing(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.exporter = ListExporter()
+        patcher = patch.multiple(tracer, exporter=self.exporter, sample_ratio=1.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_child_spans(self):
+        with tracer.start_trace('root') as root:
+            with tracer.span('child', key='value'):
+                pass
+        child, parent = self.exporter.spans
+        self.assertEqual(child['name'], 'child')
+        self.assertEqual(child['parentSpanId'], root.span_id)
+        self.assertEqual(child['traceId'], parent['traceId'])
+        self.assertEqual(child['attributes'], {'key': 'value'})
+        self.assertEqual(parent['parentSpanId'], '')
+
+    def test_not_sampled(self):
+        self.assertIs(Tracer(ListExporter(), sample_ratio=0).start_trace('root'), NULL_SPAN)
+        self.assertIs(Tracer(None).start_trace('root'), NULL_SPAN)
+        self.assertIs(tracer.span('orphan'), NULL_SPAN)
+
+    def test_traceparent(self):
+        sampler = Tracer(ListExporter(), sample_ratio=0)
+        span = sampler.start_trace('root', '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01')
+        self.assertEqual(span.trace_id, '4bf92f3577b34da6a3ce929d0e0e4736')
+        self.assertEqual(span.parent_id, '00f067aa0ba902b7')
+        self.assertIs(tracer.start_trace('root', '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00'),
+                      NULL_SPAN)
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            with tracer.start_trace('root'):
+                raise ValueError('boom')
+        self.assertEqual(self.exporter.spans[0]['status']['code'], 'ERROR')
+
+    async def test_instrument_module(self):
+        module = types.ModuleType('fake_repository')
+
+        async def get_item(item_id):
+            return item_id
+
+        get_item.__module__ = module.__name__
+        module.get_item = get_item
+        self.assertEqual(instrument_module(module, 'repository.fake'), ['get_item'])
+        self.assertEqual(instrument_module(module, 'repository.fake'), [])
+        with tracer.start_trace('root'):
+            self.assertEqual(await module.get_item(1), 1)
+        self.assertEqual(self.exporter.spans[0]['name'], 'repository.fake.get_item')
+
+    def test_sql(self):
+        engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'tracing.db')}")
+        instrument_sql()
+        with tracer.start_trace('root'):
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        engine.dispose()
+        sql = [span for span in self.exporter.spans if span['name'] == 'sql']
+        self.assertEqual(sql[0]['attributes']['db.statement'], 'SELECT 1')
+
+    def test_middleware(self):
+        app = FastAPI()
+
+        @app.get('/items/{item_id}')
+        def get_item(item_id: int):
+            return {'id': item_id}
+
+        client = TestClient(TracingMiddleware(app, tracer))
+        client.get('/items/1')
+        root = self.exporter.spans[-1]
+        self.assertEqual(root['name'], 'GET /items/{item_id}')
+        self.assertEqual(root['attributes']['http.status_code'], 200)
+
+    def test_file_exporter(self):
+        path = os.path.join(tempfile.mkdtemp(), 'traces', 'spans.jsonl')
+        exporter = FileExporter(path)
+        exporter.export({'name': 'root'})
+        exporter.close()
+        with open(path) as f:
+            self.assertEqual(f.read(), '{"name": "root"}\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from sqlalchemy import create_engine
+
+from src.services.email import Mailer
+from src.services.resources import Resources
+from src.services.warmup import Warmup
+
+
+class TestWarmup(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'warmup.db')
+        self.engine = create_engine(f'sqlite:///{self.path}', pool_size=3)
+        self.resources = Resources(engine=self.engine)
+        self.resources._redis = MagicMock()
+        self.resources._redis.ping = AsyncMock(return_value=True)
+        self.resources._cache = MagicMock()
+        self.resources._mailer = Mailer(pool_size=1)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_open_connections(self):
+        warmup = Warmup(self.resources, db_connections=10)
+        self.assertEqual(warmup.open_connections(), 3)
+        self.assertEqual(self.engine.pool.checkedin(), 3)
+
+    async def test_run(self):
+        warmup = Warmup(self.resources, db_connections=2)
+        result = await warmup.run()
+        self.assertTrue(result)
+        self.assertTrue(warmup.ready)
+        self.assertEqual(set(warmup.checks), {'database', 'redis', 'crypto', 'templates'})
+        self.resources.redis.ping.assert_awaited_once()
+        self.resources.cache.ping.assert_called_once()
+        self.assertIn('email_template.html', self.resources.mailer.templates)
+
+    async def test_run_not_ready(self):
+        warmup = Warmup(self.resources, db_connections=1)
+        self.resources.redis.ping.side_effect = ConnectionError('redis is down')
+        result = await warmup.run()
+        self.assertFalse(result)
+        self.assertFalse(warmup.ready)
+        self.assertTrue(warmup.checks['redis'].startswith('failed'))
+        self.assertTrue(warmup.checks['templates'].startswith('ok'))
+        await warmup.stop()
+
+    async def test_retry_until_ready(self):
+        warmup = Warmup(self.resources, db_connections=1, retry_backoff=0.01, retry_max_backoff=0.02)
+        self.resources.redis.ping.side_effect = [ConnectionError('redis is down'), ConnectionError('redis is down'),
+                                                 True]
+        self.assertFalse(await warmup.run())
+        await asyncio.wait_for(warmup.task, 1)
+        self.assertTrue(warmup.ready)
+        self.assertTrue(warmup.checks['redis'].startswith('ok'))
+        self.assertEqual(self.resources.redis.ping.await_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()